@@ -0,0 +1,393 @@
+"""Event-driven http-fetcher for the feed update.
+
+Python 2 has no asyncio, so this does the same job with asyncore:
+one thread, many sockets. FetchEngine downloads a list of urls with
+at most 'connections' sockets open at the same time and hands every
+response back as soon as it is complete. getaddrinfo blocks, so the
+host names are resolved by a few helper-threads (through the cache
+of httppool) while the sockets of resolved hosts are already busy.
+"""
+
+import asyncore
+import collections
+import select
+import socket
+import ssl
+import sys
+import time
+import urlparse
+import zlib
+from multiprocessing.pool import ThreadPool
+
+import httppool
+
+USER_AGENT = 'Fussels Podcatcher'
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+#threads resolving host names
+RESOLVER_THREADS = 8
+
+
+class Response(object):
+    """result of one fetch
+    """
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.headers = {}
+        self.body = ''
+        self.error = None
+
+
+class _Connection(asyncore.dispatcher):
+    """one http(s)-request. It speaks HTTP/1.0, so the body simply
+    ends when the server closes the connection.
+    """
+    def __init__(self, engine, key, url, headers, redirects, addresses):
+        asyncore.dispatcher.__init__(self, map=engine.map)
+        self.engine = engine
+        self.key = key
+        self.url = url
+        self.headers = headers
+        self.redirects = redirects
+        self.inbuf = []
+        self.handshaking = False
+        self.wantWrite = False
+        self.done = False
+        self.lastActivity = time.time()
+
+        parts = urlparse.urlsplit(url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        hostHeader = self.host
+        if parts.port:
+            hostHeader += ':%d' % parts.port
+
+        request = [
+            'GET %s HTTP/1.0' % path,
+            'Host: %s' % hostHeader,
+            'User-Agent: %s' % USER_AGENT,
+            'Accept-Encoding: gzip, deflate',
+            'Connection: close',
+        ]
+        for name, value in headers.items():
+            request.append('%s: %s' % (name, value))
+        self.outbuf = '\r\n'.join(request) + '\r\n\r\n'
+
+        # like httppool every address is tried until one connects
+        self.addresses = list(addresses)
+        self._connectNext()
+
+    def _connectNext(self):
+        """connect to the next address, raises socket.error if the
+        last one fails at once
+        """
+        while True:
+            family, socktype, _, _, address = self.addresses.pop(0)
+            self.create_socket(family, socktype)
+            try:
+                self.connect(address)
+                return
+            except socket.error:
+                self.close()
+                if not self.addresses:
+                    raise
+
+    def _retryConnect(self):
+        """True if a failed connect goes on with the next address
+        """
+        if not (self.connecting and self.addresses):
+            return False
+        self.close()
+        try:
+            self._connectNext()
+        except socket.error as e:
+            self.finish(str(e))
+        self.lastActivity = time.time()
+        return True
+
+    def readable(self):
+        return not self.done
+
+    def writable(self):
+        if self.done:
+            return False
+        if self.connecting or self.wantWrite:
+            return True
+        return not self.handshaking and bool(self.outbuf)
+
+    def handle_connect(self):
+        if self.https:
+            context = ssl.create_default_context()
+            self.socket = context.wrap_socket(
+                self.socket,
+                server_hostname=self.host,
+                do_handshake_on_connect=False
+            )
+            self.handshaking = True
+            self._handshake()
+
+    def _handshake(self):
+        try:
+            self.socket.do_handshake()
+        except ssl.SSLWantReadError:
+            self.wantWrite = False
+        except ssl.SSLWantWriteError:
+            self.wantWrite = True
+        else:
+            self.handshaking = False
+            self.wantWrite = False
+        self.lastActivity = time.time()
+
+    def handle_write(self):
+        if self.handshaking:
+            self._handshake()
+            return
+        try:
+            sent = self.send(self.outbuf)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return
+        self.outbuf = self.outbuf[sent:]
+        self.lastActivity = time.time()
+
+    def handle_read(self):
+        if self.handshaking:
+            self._handshake()
+            return
+        while not self.done:
+            try:
+                data = self.recv(65536)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return
+            except ssl.SSLEOFError:
+                # server closed without close_notify, the body is complete
+                self.handle_close()
+                return
+            if not data:
+                return
+            self.inbuf.append(data)
+            self.lastActivity = time.time()
+            # ssl may hold decrypted data that select() doesn't see
+            if not (self.https and self.socket.pending()):
+                return
+
+    def handle_close(self):
+        if not self._retryConnect():
+            self.finish()
+
+    def handle_error(self):
+        error = str(sys.exc_info()[1]) or 'connection failed'
+        if not self._retryConnect():
+            self.finish(error)
+
+    def finish(self, error=None):
+        """close the connection and hand the response to the engine
+        """
+        if self.done:
+            return
+        self.done = True
+        self.close()
+        response = Response(self.url)
+        if error is None:
+            try:
+                _parseResponse(''.join(self.inbuf), response)
+            except (ValueError, zlib.error) as e:
+                error = 'bad response: %s' % e
+        self.inbuf = []
+        response.error = error
+        self.engine._finished(self, response)
+
+
+class FetchEngine(object):
+    """fetch many urls at once from a single thread
+
+    engine = FetchEngine(connections=8)
+    engine.add(key, url, {'If-None-Match': etag})
+    for key, response in engine.run():
+        ...
+    """
+    def __init__(self, connections=8, timeout=30):
+        self.connections = max(1, connections)
+        self.timeout = timeout
+        self.map = {}
+        self.waiting = collections.deque()
+        self.active = []
+        self.completed = collections.deque()
+        # (host, port) -> (addresses, error), None while resolving
+        self.addresses = {}
+        self.resolver = None
+
+    def add(self, key, url, headers=None):
+        """queue an url, key is handed back together with its response
+        """
+        self.waiting.append((key, url, headers or {}, MAX_REDIRECTS))
+
+    def run(self):
+        """fetch all queued urls and yield (key, Response)-tuples in
+        the order the downloads complete. The fetching pauses while
+        the caller works on a response.
+        """
+        usePoll = hasattr(select, 'poll')
+        self.resolver = ThreadPool(RESOLVER_THREADS)
+        for key, url, headers, redirects in self.waiting:
+            self._lookup(url)
+        try:
+            while self.waiting or self.active or self.completed:
+                self._startResolved()
+                while self.completed:
+                    yield self.completed.popleft()
+                if self.active:
+                    asyncore.loop(
+                        timeout=0.2, map=self.map, use_poll=usePoll, count=1
+                    )
+                    self._checkTimeouts()
+                elif self.waiting:
+                    # nothing to do until a name is resolved
+                    time.sleep(0.01)
+        finally:
+            self.resolver.terminate()
+            self.resolver = None
+
+    def _startResolved(self):
+        """start the waiting urls whose host is resolved, in their
+        order, while connections are free. The others keep waiting.
+        """
+        waiting = collections.deque()
+        while self.waiting and len(self.active) < self.connections:
+            job = self.waiting.popleft()
+            key, url, headers, redirects = job
+            hostPort = self._lookup(url)
+            if hostPort is None:
+                self._fail(key, url, "unsupported url: %s" % url)
+                continue
+            if self.addresses[hostPort] is None:
+                waiting.append(job)
+                continue
+            addresses, error = self.addresses[hostPort]
+            if error is not None:
+                self._fail(key, url, error)
+                continue
+            self._start(key, url, headers, redirects, addresses)
+        waiting.extend(self.waiting)
+        self.waiting = waiting
+
+    def _lookup(self, url):
+        """start resolving the host of url if that isn't done yet,
+        return its (host, port) or None for unsupported urls
+        """
+        try:
+            hostPort = _hostPort(url)
+        except ValueError:
+            return None
+        if hostPort not in self.addresses:
+            self.addresses[hostPort] = None
+            self.resolver.apply_async(
+                _resolve, (hostPort,), callback=self._resolved)
+        return hostPort
+
+    def _resolved(self, result):
+        # called in a resolver-thread, a dict-item is set atomically
+        hostPort, addresses, error = result
+        self.addresses[hostPort] = (addresses, error)
+
+    def _start(self, key, url, headers, redirects, addresses):
+        try:
+            connection = _Connection(
+                self, key, url, headers, redirects, addresses)
+        except (socket.error, ValueError) as e:
+            self._fail(key, url, e)
+        else:
+            if not connection.done:
+                self.active.append(connection)
+
+    def _fail(self, key, url, error):
+        response = Response(url)
+        response.error = str(error)
+        self.completed.append((key, response))
+
+    def _finished(self, connection, response):
+        if connection in self.active:
+            self.active.remove(connection)
+        location = response.headers.get('location')
+        if (response.status in REDIRECT_CODES and location
+                and connection.redirects > 0):
+            url = urlparse.urljoin(connection.url, location)
+            self._lookup(url)
+            self.waiting.appendleft((
+                connection.key, url, connection.headers,
+                connection.redirects - 1
+            ))
+        else:
+            self.completed.append((connection.key, response))
+
+    def _checkTimeouts(self):
+        now = time.time()
+        for connection in self.active[:]:
+            if now - connection.lastActivity > self.timeout:
+                connection.finish('timed out')
+
+
+def _hostPort(url):
+    """(host, port) to connect to for url
+    """
+    parts = urlparse.urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError("unsupported url: %s" % url)
+    return parts.hostname, parts.port or (
+        443 if parts.scheme == 'https' else 80)
+
+def _resolve(hostPort):
+    """resolver-job: (hostPort, addresses, error)
+    """
+    try:
+        return hostPort, httppool.resolve(*hostPort), None
+    except Exception as e:
+        # the callback must get every result, or the url waits forever
+        return hostPort, None, e
+
+def _parseResponse(raw, response):
+    """fill response with status, headers and the decoded body
+    """
+    head, sep, body = raw.partition('\r\n\r\n')
+    if not sep:
+        raise ValueError('incomplete header')
+    lines = head.split('\r\n')
+    status = lines[0].split(None, 2)
+    if len(status) < 2 or not status[0].startswith('HTTP/'):
+        raise ValueError('no status line')
+    response.status = int(status[1])
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            response.headers[name.strip().lower()] = value.strip()
+
+    if response.headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = _unchunk(body)
+    encoding = response.headers.get('content-encoding', '').lower()
+    if encoding in ('gzip', 'x-gzip'):
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    response.body = body
+
+def _unchunk(body):
+    """decode a body sent with 'Transfer-Encoding: chunked'
+    """
+    chunks = []
+    pos = 0
+    while True:
+        end = body.find('\r\n', pos)
+        if end < 0:
+            break
+        size = int(body[pos:end].split(';')[0].strip() or '0', 16)
+        if not size:
+            break
+        chunks.append(body[end + 2:end + 2 + size])
+        pos = end + 2 + size + 2
+    return ''.join(chunks)
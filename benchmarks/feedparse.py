@@ -0,0 +1,191 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+"""
+Compare feedparser and streamfeed on big synthetic feeds.
+
+usage: python benchmarks/feedparse.py [entries ...]
+       python benchmarks/feedparse.py --check
+
+Every parser runs in a child process, so its peak memory can be
+measured on its own. --check compares the Post.hash both parsers
+give for the items of CHECK_FEEDS instead, they must be the same or
+'update --stream' takes known posts for new ones.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from email.utils import formatdate
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+ITEM = u'''<item>
+<title>Episode %(i)d: über alles</title>
+<itunes:subtitle>Subtitle of episode %(i)d</itunes:subtitle>
+<itunes:author>Some Author</itunes:author>
+<description>%(description)s</description>
+<pubDate>%(date)s</pubDate>
+<link>http://example.com/episode/%(i)d</link>
+<enclosure url="http://cdn.example.com/%(i)d.mp3" length="12345678" type="audio/mpeg"/>
+</item>
+'''
+
+RSS = u'''<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"
+ xmlns:dc="http://purl.org/dc/elements/1.1/"
+ xmlns:media="http://search.yahoo.com/mrss/">
+<channel><title>Check</title><author>Channel Author</author>%s</channel></rss>
+'''
+ATOM = u'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"
+ xmlns:dc="http://purl.org/dc/elements/1.1/">
+<title>Check</title><author><name>Feed Author</name></author>%s</feed>
+'''
+#(kind, feed, items), every item is a post of its own
+CHECK_FEEDS = [
+    ('rss 2.0', RSS, [
+        u'<item><title>Plain</title><author>a@example.com (A)</author>'
+        u'<pubDate>Mon, 01 Jan 2024 10:00:00 +0200</pubDate></item>',
+        u'<item><title>No date, no author</title></item>',
+        u'<item><title></title><title>Second title</title>'
+        u'<author>A</author><author></author></item>',
+        u'<item><title>Two dates</title>'
+        u'<pubDate>Mon, 01 Jan 2024 10:00:00 GMT</pubDate>'
+        u'<pubDate>Tue, 02 Jan 2024 10:00:00 GMT</pubDate></item>',
+    ]),
+    ('itunes', RSS, [
+        u'<item><title>Both authors</title><author>a@example.com (A)</author>'
+        u'<itunes:author>iTunes Author</itunes:author>'
+        u'<pubDate>Mon, 01 Jan 2024 10:00:00 GMT</pubDate></item>',
+        u'<item><itunes:title>iTunes title</itunes:title><title>Title</title>'
+        u'<media:title>Media title</media:title>'
+        u'<itunes:author>iTunes Author</itunes:author><author>A</author>'
+        u'<itunes:subtitle>one</itunes:subtitle>'
+        u'<itunes:subtitle>two</itunes:subtitle></item>',
+    ]),
+    ('atom', ATOM, [
+        u'<entry><title>Atom</title><author><name>N</name>'
+        u'<email>n@example.com</email></author>'
+        u'<published>2024-01-01T10:00:00Z</published>'
+        u'<updated>2024-02-01T10:00:00Z</updated></entry>',
+        u'<entry><title>Only updated</title>'
+        u'<updated>2024-02-01T10:00:00Z</updated>'
+        u'<author><name>N</name></author><author><name>M</name></author>'
+        u'</entry>',
+        u'<entry><title>Email only</title>'
+        u'<author><email>n@example.com</email></author>'
+        u'<issued>2024-01-01T10:00:00Z</issued></entry>',
+    ]),
+    ('dc', RSS, [
+        u'<item><title>Dublin Core</title><dc:creator>Creator</dc:creator>'
+        u'<dc:date>2024-01-01T10:00:00Z</dc:date></item>',
+        u'<item><title>Both dates</title><dc:creator>Creator</dc:creator>'
+        u'<itunes:author>iTunes Author</itunes:author>'
+        u'<dc:date>2024-03-01T10:00:00Z</dc:date>'
+        u'<pubDate>Mon, 01 Jan 2024 10:00:00 GMT</pubDate></item>',
+    ]),
+]
+
+def check():
+    """print the posts of CHECK_FEEDS whose hashes differ between
+    feedparser and streamfeed, return how many
+    """
+    from StringIO import StringIO
+    import feedparser
+    import streamfeed
+    from podcatcher import Post
+    differences = 0
+    for kind, feed, items in CHECK_FEEDS:
+        xml = (feed % u''.join(items)).encode('utf-8')
+        parsed = feedparser.parse(xml).entries
+        streamed = list(streamfeed.parseFile(StringIO(xml)).entries)
+        if len(parsed) != len(streamed):
+            print "%-8s %d entries by feedparser, %d by streamfeed" % (
+                kind, len(parsed), len(streamed))
+            differences += 1
+            continue
+        for number, entries in enumerate(zip(parsed, streamed)):
+            posts = []
+            for entry in entries:
+                post = Post(1)
+                post.identify(entry)
+                posts.append(post)
+            if posts[0].hash != posts[1].hash:
+                differences += 1
+                print "%-8s item %d differs:" % (kind, number)
+                for parser, post in zip(('feedparser', 'streamfeed'), posts):
+                    print "  %-11s %r %r %r" % (
+                        parser, post.title, post.author, post.hashDate)
+    print "%d differences" % differences
+    return differences
+
+def writeFeed(path, entries, descriptionSize=2000):
+    """write a feed with this many entries, newest first
+    """
+    description = (u'Lorem ipsum dolor sit amet. ' * (
+        descriptionSize // 28 + 1))[:descriptionSize]
+    with open(path, 'w') as fh:
+        fh.write(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<rss version="2.0" '
+            'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+            '<channel><title>Benchmark</title>\n'
+        )
+        for i in range(entries, 0, -1):
+            fh.write((ITEM % {
+                'i': i,
+                'description': description,
+                'date': formatdate(1400000000 + i * 3600, usegmt=True),
+            }).encode('utf-8'))
+        fh.write('</channel></rss>\n')
+
+def run(parser, path):
+    """parse path with parser and print entries, seconds and peak rss
+    """
+    start = time.time()
+    if parser == 'feedparser':
+        import feedparser
+        count = 0
+        for entry in feedparser.parse(path).entries:
+            count += 1
+    else:
+        import streamfeed
+        count = 0
+        with open(path, 'rb') as fh:
+            for entry in streamfeed.parseFile(fh).entries:
+                count += 1
+    seconds = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print count, seconds, peak
+
+def main(args):
+    sizes = [int(arg) for arg in args] or [1000, 5000, 20000]
+    print "%8s %-11s %9s %12s" % ('entries', 'parser', 'seconds', 'peak rss MB')
+    for entries in sizes:
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        try:
+            writeFeed(path, entries)
+            for parser in ('feedparser', 'streamfeed'):
+                output = subprocess.check_output(
+                    [sys.executable, __file__, '--run', parser, path]
+                )
+                count, seconds, peak = output.split()
+                # ru_maxrss is in kilobytes on linux
+                print "%8s %-11s %9.2f %12.1f" % (
+                    count, parser, float(seconds), int(peak) / 1024.0
+                )
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(sys.argv[2], sys.argv[3])
+    elif sys.argv[1:2] == ['--check']:
+        sys.exit(1 if check() else 0)
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,213 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+"""
+Local http-server with synthetic feeds and media for the benchmarks.
+
+    server = FeedServer(feeds=20, entries=20)
+    server.start()
+    server.feedUrl(0)   # http://127.0.0.1:<port>/feed/0
+    ...
+    server.takeTimings()
+    server.stop()
+
+/feed/<n> is a newest-first RSS-feed with 'entries' episodes, one
+every 'spacing' seconds up to now, with ETag support.
+/media/<n>/<i>.mp3 is a 'mediaSize' bytes mp3 (an empty ID3v2.3-tag
+and silent MPEG-frames, so it can be tagged) with Range support.
+Every response can be delayed by 'latency' seconds, throttled to
+'bandwidth' bytes per second and connection, and replaced by a 500
+with the probability 'errorRate'. Connections are kept alive.
+"""
+
+import BaseHTTPServer
+import random
+import SocketServer
+import threading
+import time
+from email.utils import formatdate
+
+FEED = u'''<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+<channel>
+<title>Benchmark Cast %(feed)d</title>
+<link>http://%(host)s/</link>
+<image><url>http://%(host)s/media/%(feed)d/cover.jpg</url></image>
+%(items)s
+</channel>
+</rss>
+'''
+ITEM = u'''<item>
+<title>Episode %(i)d of cast %(feed)d: über alles</title>
+<itunes:subtitle>Subtitle of episode %(i)d</itunes:subtitle>
+<itunes:author>Some Author</itunes:author>
+<description>%(description)s</description>
+<pubDate>%(date)s</pubDate>
+<link>http://%(host)s/episode/%(feed)d/%(i)d</link>
+<enclosure url="http://%(host)s/media/%(feed)d/%(i)d.mp3" length="%(size)d" type="audio/mpeg"/>
+</item>
+'''
+# empty ID3v2.3-header and one MPEG-1 layer III frame, 128 kbit/s 44.1 kHz
+ID3_HEADER = 'ID3\x03\x00\x00\x00\x00\x00\x00'
+MPEG_FRAME = '\xff\xfb\x90\x64' + '\x00' * 413
+
+
+class FeedServer(object):
+    def __init__(self, feeds=20, entries=20, mediaSize=65536,
+                 descriptionSize=500, spacing=3600, latency=0,
+                 bandwidth=0, errorRate=0, seed=0):
+        self.feeds = feeds
+        self.entries = entries
+        self.mediaSize = mediaSize
+        self.descriptionSize = descriptionSize
+        self.spacing = spacing
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.errorRate = errorRate
+        self.random = random.Random(seed)
+        self.now = int(time.time())
+        self.lock = threading.Lock()
+        self.timings = []
+        self.active = 0
+        self.server = None
+        self.host = None
+        self._feedCache = {}
+        self._media = None
+
+    def start(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.feedServer = self
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def feedUrl(self, feed):
+        return 'http://%s/feed/%d' % (self.host, feed)
+
+    def takeTimings(self, wait=2.0):
+        """return and forget the (kind, seconds, status, bytes) of
+        all requests served so far. Requests still being answered
+        are waited for up to 'wait' seconds.
+        """
+        deadline = time.time() + wait
+        while self.active and time.time() < deadline:
+            time.sleep(0.01)
+        with self.lock:
+            timings, self.timings = self.timings, []
+        return timings
+
+    def isError(self):
+        with self.lock:
+            return self.random.random() < self.errorRate
+
+    def begin(self):
+        with self.lock:
+            self.active += 1
+
+    def record(self, kind, seconds, status, size):
+        with self.lock:
+            self.active -= 1
+            self.timings.append((kind, seconds, status, size))
+
+    def getFeed(self, feed):
+        if feed not in self._feedCache:
+            description = (u'Lorem ipsum dolor sit amet. ' * (
+                self.descriptionSize // 28 + 1))[:self.descriptionSize]
+            items = u''.join(ITEM % {
+                'i': i, 'feed': feed, 'host': self.host,
+                'description': description, 'size': self.mediaSize,
+                'date': formatdate(self.now - i * self.spacing, usegmt=True),
+            } for i in range(self.entries))
+            self._feedCache[feed] = (FEED % {
+                'feed': feed, 'host': self.host, 'items': items,
+            }).encode('utf-8')
+        return self._feedCache[feed]
+
+    def getMedia(self):
+        if self._media is None:
+            frames = self.mediaSize // len(MPEG_FRAME) + 1
+            self._media = (ID3_HEADER + MPEG_FRAME * frames)[:self.mediaSize]
+        return self._media
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # the default of 5 overflows with parallel clients, they then wait
+    # a second for the SYN-retransmit
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        feedServer = self.server.feedServer
+        start = time.time()
+        feedServer.begin()
+        parts = self.path.strip('/').split('/')
+        kind = parts[0]
+        # status 0: the client went away while answering
+        status, size = 0, 0
+        try:
+            if feedServer.latency:
+                time.sleep(feedServer.latency)
+            if feedServer.isError():
+                status, size = self._send(500, 'server error', 'text/plain')
+            elif kind == 'feed' and len(parts) == 2:
+                status, size = self._sendFeed(feedServer, int(parts[1]))
+            elif kind == 'media' and len(parts) == 3:
+                status, size = self._sendMedia(feedServer)
+            else:
+                status, size = self._send(404, 'not found', 'text/plain')
+        finally:
+            feedServer.record(kind, time.time() - start, status, size)
+
+    def _sendFeed(self, feedServer, feed):
+        etag = '"bench-%d"' % feed
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, '', None)
+        return self._send(
+            200, feedServer.getFeed(feed), 'application/rss+xml',
+            {'ETag': etag}
+        )
+
+    def _sendMedia(self, feedServer):
+        body = feedServer.getMedia()
+        headers = {'Accept-Ranges': 'bytes', 'ETag': '"media"'}
+        contentRange = self.headers.get('Range', '')
+        if contentRange.startswith('bytes=') and \
+                self.headers.get('If-Range', '"media"') == '"media"':
+            start = int(contentRange[6:].split('-')[0] or 0)
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, len(body) - 1, len(body))
+            return self._send(206, body[start:], 'audio/mpeg', headers)
+        return self._send(200, body, 'audio/mpeg', headers)
+
+    def _send(self, status, body, contentType, headers={}):
+        self.send_response(status)
+        if contentType:
+            self.send_header('Content-Type', contentType)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        bandwidth = self.server.feedServer.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return status, len(body)
+        # ten slices per second
+        step = max(1, bandwidth // 10)
+        for offset in range(0, len(body), step):
+            self.wfile.write(body[offset:offset + step])
+            time.sleep(0.1)
+        return status, len(body)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+"""
+Memory used by Post-objects loaded from a database with many shows.
+
+usage: python benchmarks/postmemory.py [shows]
+
+Builds a temporary database with this many shows (default 100000),
+then loads all of them in child processes: once as plain rows, once
+as Post-objects and once as Post-objects whose lazy fields (daysOld,
+printableTitle) are used, like 'status' does.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import helper
+
+QUERY = "SELECT feed_id, id, title, subtitle, author, published, \
+    media_link, hash, status, display_title FROM shows"
+
+def createDatabase(path, shows):
+    import db
+    helper.DB_PATH = path
+    db.migrate()
+    with helper.transaction(), helper.DB() as dbHandler:
+        dbHandler.sql(
+            "INSERT INTO casts (title, url, status, short_title, \
+            display_title) VALUES ('Benchmark', 'http://example.com/feed', \
+            0, 'bench', 'Benchmark')"
+        )
+        dbHandler.sqlmany(
+            "INSERT INTO shows VALUES (?,?,?,?,?,?,?,?,?,?)",
+            ((None, 1, u'Episode %d: \xfcber alles' % i,
+              u'Subtitle of episode %d' % i, u'Some Author',
+              u'http://cdn.example.com/%d.mp3' % i, 1400000000 + i * 3600,
+              1, '%064x' % i, u'Episode %d: \xfcber alles' % i)
+             for i in xrange(shows))
+        )
+
+def run(mode, path):
+    """load all shows and print seconds and rss-growth in kB
+    """
+    helper.DB_PATH = path
+    import podcatcher
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    with helper.DB() as dbHandler:
+        rows = dbHandler.sql(QUERY)
+    loaded = rows
+    if mode != 'rows':
+        loaded = []
+        for row in rows:
+            post = podcatcher.Post(row[0])
+            post.fromDbRow(row)
+            if mode == 'lazy':
+                post.daysOld, post.printableTitle
+            loaded.append(post)
+        del rows
+    seconds = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print len(loaded), seconds, after - before
+
+def main(args):
+    shows = int(args[0]) if args else 100000
+    fd, path = tempfile.mkstemp(suffix='.sq3')
+    os.close(fd)
+    try:
+        createDatabase(path, shows)
+        print "%8s %-6s %9s %10s %10s" % (
+            'shows', 'mode', 'seconds', 'MB', 'bytes/show')
+        for mode in ('rows', 'posts', 'lazy'):
+            output = subprocess.check_output(
+                [sys.executable, __file__, '--run', mode, path]
+            )
+            count, seconds, grown = output.split()
+            # ru_maxrss is in kilobytes on linux
+            print "%8s %-6s %9.2f %10.1f %10d" % (
+                count, mode, float(seconds), int(grown) / 1024.0,
+                int(grown) * 1024 // max(1, int(count))
+            )
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(sys.argv[2], sys.argv[3])
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,64 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+"""
+Compare makePrintable with the former character-by-character version.
+
+usage: python benchmarks/printable.py [title-length ...]
+
+Every length runs with a plain ascii title, a german one and one
+full of characters that get replaced, both versions must give the
+same result.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper import makePrintable
+
+TITLES = [
+    ('ascii', u'Episode 42: The answer - part 1 of 3. '),
+    ('umlauts', u'Folge 42: Über Größe, Maß und Ärger. '),
+    ('foreign', u'第42集 «Ответ» — ¿qué? ★ '),
+]
+
+def legacyMakePrintable(unprintable):
+    """makePrintable before it used one precompiled pattern
+    """
+    return "".join(
+        [['{?}',x][re.match(u"[\[\]\w -.:@~/äöüÄÖÜß]",x)!=None] for x in unprintable ]
+    )
+
+def measure(function, title, minimum=0.2):
+    """seconds per call, repeated for at least 'minimum' seconds
+    """
+    calls = 0
+    start = time.time()
+    while True:
+        for i in range(10):
+            function(title)
+        calls += 10
+        seconds = time.time() - start
+        if seconds >= minimum:
+            return seconds / calls
+
+def main(args):
+    lengths = [int(arg) for arg in args] or [40, 200, 1000]
+    print "%7s %-8s %12s %12s %8s" % (
+        'length', 'title', 'legacy us', 'current us', 'speedup')
+    for length in lengths:
+        for name, text in TITLES:
+            title = (text * (length // len(text) + 1))[:length]
+            if legacyMakePrintable(title) != makePrintable(title):
+                raise AssertionError("different result for %r" % title)
+            legacy = measure(legacyMakePrintable, title)
+            current = measure(makePrintable, title)
+            print "%7d %-8s %12.1f %12.1f %7.1fx" % (
+                length, name, legacy * 1e6, current * 1e6, legacy / current)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
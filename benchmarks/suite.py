@@ -0,0 +1,192 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+"""
+Run podcatcher against the local feedserver and measure it.
+
+usage: python benchmarks/suite.py [--feeds 20] [--entries 20]
+           [--media-size 65536] [--latency 0.0] [--bandwidth 0]
+           [--error-rate 0.0] [--jobs 8] [--json]
+
+A temporary database gets 'feeds' casts of the synthetic server,
+then these commands run one after the other, each in a child
+process:
+
+    update all      (every feed is new)
+    update all      (again, the server answers 304)
+    get --all       (downloads every new episode)
+    status -n
+    status -l 1
+
+For every command the table shows seconds, throughput, percentiles
+of the request-latencies seen by the server, peak RSS of the child
+and the number of sql-statements. With --json one JSON-object per
+command is printed instead.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASE)
+
+from feedserver import FeedServer
+
+COMMANDS = [
+    ('update', ['update', 'all']),
+    ('update-304', ['update', 'all']),
+    ('get', ['get', '--all']),
+    ('status-n', ['status', '-n']),
+    ('status-l', ['status', '-l', '1']),
+]
+
+
+def createDatabase(path, server):
+    import db
+    import helper
+    helper.DB_PATH = path
+    db.migrate()
+    with helper.transaction(), helper.DB() as dbHandler:
+        dbHandler.sqlmany(
+            "INSERT INTO casts (title, url, status, short_title, \
+            display_title) VALUES (?, ?, 0, ?, ?)",
+            ((u'Benchmark Cast %d' % feed, server.feedUrl(feed),
+              u'bench%d' % feed, u'Benchmark Cast %d' % feed)
+             for feed in range(server.feeds))
+        )
+
+def run(dbPath, mediaPath, args):
+    """run one podcatcher-command with its output thrown away and
+    print the measurements as JSON
+    """
+    import helper
+    helper.DB_PATH = dbPath
+    import podcatcher
+    podcatcher.MEDIA_PATH = mediaPath
+
+    stdout = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    start = time.time()
+    try:
+        podcatcher.main(args)
+    finally:
+        sys.stdout.flush()
+        seconds = time.time() - start
+        os.dup2(stdout, 1)
+    with helper.DB() as dbHandler:
+        shows = dbHandler.sql("SELECT COUNT(*) FROM shows")[0][0]
+    print json.dumps({
+        'seconds': seconds,
+        # ru_maxrss is in kilobytes on linux
+        'peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'statements': helper.getStatementCount(),
+        'shows': shows,
+    })
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def summarize(name, measured, timings):
+    seconds = measured['seconds']
+    transferred = sum(size for kind, took, status, size in timings)
+    latencies = [took for kind, took, status, size in timings]
+    return {
+        'command': name,
+        'seconds': round(seconds, 3),
+        'requests': len(timings),
+        'errors': sum(1 for t in timings if t[2] >= 500),
+        'requests_per_s': round(len(timings) / seconds, 1),
+        'mb_per_s': round(transferred / 1048576.0 / seconds, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'peak_rss_mb': round(measured['peak_rss_mb'], 1),
+        'statements': measured['statements'],
+        'shows': measured['shows'],
+    }
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='benchmark podcatcher against a local feed-server'
+    )
+    parser.add_argument('--feeds', type=int, default=20)
+    parser.add_argument('--entries', type=int, default=20,
+        help='episodes per feed')
+    parser.add_argument('--media-size', type=int, default=65536,
+        help='bytes per episode')
+    parser.add_argument('--description-size', type=int, default=500,
+        help='characters of description per episode')
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='seconds before every response')
+    parser.add_argument('--bandwidth', type=int, default=0,
+        help='bytes per second and connection, 0 is unlimited')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+        help='fraction of requests answered with 500')
+    parser.add_argument('--jobs', type=int, default=8,
+        help='-j of update and get')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true',
+        help='print JSON lines instead of a table')
+    arguments = parser.parse_args(args)
+
+    server = FeedServer(
+        feeds=arguments.feeds, entries=arguments.entries,
+        mediaSize=arguments.media_size,
+        descriptionSize=arguments.description_size,
+        latency=arguments.latency, bandwidth=arguments.bandwidth,
+        errorRate=arguments.error_rate, seed=arguments.seed
+    )
+    server.start()
+    tmp = tempfile.mkdtemp()
+    try:
+        dbPath = os.path.join(tmp, 'bench.sq3')
+        mediaPath = os.path.join(tmp, 'media') + '/'
+        os.mkdir(mediaPath)
+        # helper.log writes to logs/ below the working directory
+        os.mkdir(os.path.join(tmp, 'logs'))
+        createDatabase(dbPath, server)
+        # podcatcher prints unicode-titles, stdout is no terminal here
+        env = dict(os.environ, PYTHONIOENCODING='utf-8')
+        if not arguments.json:
+            print "%-11s %8s %6s %6s %8s %7s %8s %8s %8s %8s %7s" % (
+                'command', 'seconds', 'reqs', 'errs', 'reqs/s', 'MB/s',
+                'p50 ms', 'p90 ms', 'p99 ms', 'rss MB', 'stmts')
+        for name, command in COMMANDS:
+            if command[0] in ('update', 'get'):
+                command = command + ['-j', str(arguments.jobs)]
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), '--run', dbPath, mediaPath]
+                + command, cwd=tmp, env=env
+            )
+            result = summarize(
+                name, json.loads(output.splitlines()[-1]),
+                server.takeTimings()
+            )
+            if arguments.json:
+                print json.dumps(result, sort_keys=True)
+            else:
+                print ("%(command)-11s %(seconds)8.2f %(requests)6d "
+                       "%(errors)6d %(requests_per_s)8.1f %(mb_per_s)7.2f "
+                       "%(p50_ms)8.1f %(p90_ms)8.1f %(p99_ms)8.1f "
+                       "%(peak_rss_mb)8.1f %(statements)7d" % result)
+    finally:
+        server.stop()
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(sys.argv[2], sys.argv[3], sys.argv[4:])
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,113 @@
+"""Parsing of the dates found in feeds.
+
+parseDate() understands the RFC 822 dates of RSS with a fast regex
+path, everything else goes through email.utils and a small ISO 8601
+(Atom) parser. Results are memoized, feeds repeat the same dates on
+every update.
+"""
+
+import calendar
+import re
+import time
+from datetime import datetime
+from email.utils import parsedate_tz
+
+#the format dates had in the database before they became epochs
+LEGACY_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+#offsets in minutes
+TIMEZONES = {
+    'ut': 0, 'utc': 0, 'gmt': 0, 'z': 0,
+    'est': -300, 'edt': -240, 'cst': -360, 'cdt': -300,
+    'mst': -420, 'mdt': -360, 'pst': -480, 'pdt': -420,
+    'cet': 60, 'cest': 120, 'met': 60, 'mest': 120, 'bst': 60,
+}
+
+RFC822 = re.compile(
+    r'\s*(?:[A-Za-z]+,?\s*)?'           # weekday
+    r'(\d{1,2})\s+([A-Za-z]{3})[A-Za-z]*\.?\s+(\d{2,4})\s+'
+    r'(\d{1,2}):(\d{2})(?::(\d{2}))?'
+    r'\s*([+-]\d{4}|[A-Za-z]+)?\s*$'
+)
+ISO8601 = re.compile(
+    r'\s*(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2}))?'
+    r'(?:\.\d+)?\s*(Z|[+-]\d{2}:?\d{2})?)?\s*$'
+)
+
+_cache = {}
+CACHE_SIZE = 10000
+
+
+def parseDate(dateString):
+    """return (naive, epoch) for a date of a feed or (None, None)
+    if it can't be read. naive is the datetime on the clock of the
+    feed (timezone ignored), epoch the integer unix-time (UTC).
+    """
+    try:
+        return _cache[dateString]
+    except KeyError:
+        pass
+    result = _parse(dateString)
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[dateString] = result
+    return result
+
+def formatEpoch(epoch, fmt=LEGACY_FORMAT):
+    """local time of an epoch as string, for display
+    """
+    if epoch is None:
+        return u'no date'
+    return time.strftime(fmt, time.localtime(epoch))
+
+def _parse(dateString):
+    match = RFC822.match(dateString)
+    if match:
+        day, month, year, hour, minute, second, zone = match.groups()
+        month = MONTHS.get(month.lower())
+        offset = _getOffset(zone)
+        if month and offset is not None:
+            year = int(year)
+            if year < 100:
+                year += 2000 if year < 50 else 1900
+            return _result(
+                year, month, int(day), int(hour), int(minute),
+                int(second or 0), offset
+            )
+
+    match = ISO8601.match(dateString)
+    if match:
+        year, month, day, hour, minute, second, zone = match.groups()
+        return _result(
+            int(year), int(month), int(day), int(hour or 0),
+            int(minute or 0), int(second or 0), _getOffset(zone) or 0
+        )
+
+    parsed = parsedate_tz(dateString)
+    if parsed:
+        return _result(*(parsed[:6] + ((parsed[9] or 0) // 60,)))
+    return None, None
+
+def _getOffset(zone):
+    """offset in minutes of '+0200', '-05:00', 'GMT', ... None
+    for unknown zone-names
+    """
+    if not zone:
+        return 0
+    if zone[0] in '+-':
+        digits = zone[1:].replace(':', '')
+        offset = int(digits[:2]) * 60 + int(digits[2:4])
+        return -offset if zone[0] == '-' else offset
+    return TIMEZONES.get(zone.lower())
+
+def _result(year, month, day, hour, minute, second, offset):
+    try:
+        naive = datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        return None, None
+    epoch = calendar.timegm(naive.timetuple()) - offset * 60
+    return naive, epoch
@@ -1,60 +1,213 @@
 """Database module to handle all database functions of podcatcher
 """
 
+import re
 import sqlite3
 
-DB_PATH = "C:/Daten/Projekte/Python-Projekte/podcatcher/src/database.sq3"
+from helper import DB, transaction, makePrintable
 
 ST_UPDATE_DAILY = 0
 ST_UPDATE_WEEKLY = 1
 ST_NO_UPDATE = 2
 
-class DB(object):
-    """simple handler of sqlite3 queries.
-    """
-    def __init__(self,filepath=DB_PATH):
-        self.conn = sqlite3.connect(filepath)
-        self.cursor = self.conn.cursor()
-
-    def __enter__(self):
-        """for using pythons with-statement.
-        """
-        return self
-
-    def __exit__(self, type, value, traceback):
-        """called after with-stamement block.
-        """
-        self.conn.close()
-
-    def getLastId(self):
-        return self.cursor.lastrowid
-
-    def sql(self, sql, parameters=()):
-        """execute query and return result if present.
-        """
-        self.cursor.execute(sql,parameters)
-        self.conn.commit()
-        return self.cursor.fetchall()
-
-# def createTableCasts():
-#     """database-init: table casts
-#     """
-#     with DB() as dbHandler:
-#         dbHandler.sql(
-#             "CREATE TABLE casts (id INTEGER PRIMARY KEY \
-#             AUTOINCREMENT, title TEXT, url TEXT,\
-#             last_updated TEXT, short_title TEXT, status INT)"
-#         )
-
-# def createTableShows():
-#     """database-init: table shows
-#     """
-#     with DB() as dbHandler:
-#         dbHandler.sql(
-#             "CREATE TABLE shows (id INTEGER PRIMARY KEY AUTOINCREMENT, \
-#                 feed_id TEXT, title TEXT, subtitle TEXT, author TEXT, \
-#                 media_link TEXT, published TEXT, status INT, hash TEXT)"
-#         )
+#---------------------------  schema migrations ---------------------
+# Every migration brings the schema one version further. The version of
+# a database-file is kept in 'PRAGMA user_version', 0 means the tables
+# were created before migrations existed (or not at all).
+
+def _migration_1(db_handler):
+    """tables casts and shows, casts with http-validators
+    """
+    db_handler.sql(
+        "CREATE TABLE IF NOT EXISTS casts (id INTEGER PRIMARY KEY \
+        AUTOINCREMENT, title TEXT, url TEXT,\
+        last_updated TEXT, short_title TEXT, status INT,\
+        etag TEXT, last_modified TEXT)"
+    )
+    db_handler.sql(
+        "CREATE TABLE IF NOT EXISTS shows (id INTEGER PRIMARY KEY \
+            AUTOINCREMENT, feed_id TEXT, title TEXT, subtitle TEXT, \
+            author TEXT, media_link TEXT, published TEXT, status INT, \
+            hash TEXT)"
+    )
+    columns = [row[1] for row in db_handler.sql('PRAGMA table_info(casts)')]
+    for column in ('etag', 'last_modified'):
+        if column not in columns:
+            db_handler.sql('ALTER TABLE casts ADD COLUMN %s TEXT' % column)
+
+def _migration_2(db_handler):
+    """integer feed_id, no duplicate (feed_id, hash) and indexes
+    for the common queries
+    """
+    db_handler.sql(
+        "CREATE TABLE shows_new (id INTEGER PRIMARY KEY AUTOINCREMENT, \
+            feed_id INTEGER NOT NULL, title TEXT, subtitle TEXT, \
+            author TEXT, media_link TEXT, published TEXT, status INT, \
+            hash TEXT, UNIQUE (feed_id, hash))"
+    )
+    # duplicates keep their oldest row
+    db_handler.sql(
+        "INSERT OR IGNORE INTO shows_new SELECT id, CAST(feed_id AS INTEGER), \
+            title, subtitle, author, media_link, published, status, hash \
+            FROM shows ORDER BY id"
+    )
+    db_handler.sql('DROP TABLE shows')
+    db_handler.sql('ALTER TABLE shows_new RENAME TO shows')
+    db_handler.sql(
+        'CREATE INDEX shows_feed_published ON shows (feed_id, published)')
+    db_handler.sql(
+        'CREATE INDEX shows_status_feed_published \
+        ON shows (status, feed_id, published)')
+    db_handler.sql('CREATE INDEX shows_hash ON shows (hash)')
+
+def _migration_3(db_handler):
+    """published as integer unix-time instead of text. The old
+    dates carry no timezone, they are taken as UTC.
+    """
+    db_handler.sql(
+        "CREATE TABLE shows_new (id INTEGER PRIMARY KEY AUTOINCREMENT, \
+            feed_id INTEGER NOT NULL, title TEXT, subtitle TEXT, \
+            author TEXT, media_link TEXT, published INTEGER, status INT, \
+            hash TEXT, UNIQUE (feed_id, hash))"
+    )
+    # 'no date' becomes NULL
+    db_handler.sql(
+        "INSERT INTO shows_new SELECT id, feed_id, title, subtitle, \
+            author, media_link, CAST(strftime('%s', published) AS INTEGER), \
+            status, hash FROM shows ORDER BY id"
+    )
+    db_handler.sql('DROP TABLE shows')
+    db_handler.sql('ALTER TABLE shows_new RENAME TO shows')
+    db_handler.sql(
+        'CREATE INDEX shows_feed_published ON shows (feed_id, published)')
+    db_handler.sql(
+        'CREATE INDEX shows_status_feed_published \
+        ON shows (status, feed_id, published)')
+    db_handler.sql('CREATE INDEX shows_hash ON shows (hash)')
+
+def _migration_4(db_handler):
+    """index of the files below MEDIA_PATH, see mediaindex
+    """
+    db_handler.sql(
+        "CREATE TABLE media_dirs (path TEXT PRIMARY KEY, parent TEXT, \
+            mtime REAL)"
+    )
+    db_handler.sql(
+        "CREATE TABLE media_files (path TEXT PRIMARY KEY, dir TEXT, \
+            size INTEGER, mtime REAL, expected_size INTEGER)"
+    )
+    db_handler.sql('CREATE INDEX media_dirs_parent ON media_dirs (parent)')
+    db_handler.sql('CREATE INDEX media_files_dir ON media_files (dir)')
+
+def _migration_5(db_handler):
+    """per-cast poll-interval and time of the next update, see
+    scheduler. NULL means due at once.
+    """
+    for column in ('update_interval', 'next_update'):
+        db_handler.sql('ALTER TABLE casts ADD COLUMN %s INTEGER' % column)
+    db_handler.sql(
+        'CREATE INDEX casts_status_next_update ON casts (status, next_update)')
+
+def _migration_6(db_handler):
+    """checksum of the media-files, for finding duplicates
+    """
+    db_handler.sql('ALTER TABLE media_files ADD COLUMN sha256 TEXT')
+    db_handler.sql('CREATE INDEX media_files_sha256 ON media_files (sha256)')
+
+def _migration_7(db_handler):
+    """full-text index of the shows and cast-titles, kept up to date
+    by triggers. Without FTS5 in this sqlite nothing is created and
+    search_shows and search_casts use LIKE.
+    """
+    try:
+        db_handler.sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return
+    db_handler.sql("DROP TABLE temp.fts5_probe")
+    for table, columns in FULLTEXT_TABLES:
+        fts = '%s_fts' % table
+        new = ', '.join('new.%s' % column for column in columns)
+        old = ', '.join('old.%s' % column for column in columns)
+        columns = ', '.join(columns)
+        # prefix-indexes make 'ab*' and 'abc*' cheap
+        db_handler.sql(
+            "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', \
+            content_rowid='id', prefix='2 3')" % (fts, columns, table)
+        )
+        db_handler.sql(
+            "CREATE TRIGGER %s_insert AFTER INSERT ON %s BEGIN \
+            INSERT INTO %s (rowid, %s) VALUES (new.id, %s); END"
+            % (fts, table, fts, columns, new)
+        )
+        db_handler.sql(
+            "CREATE TRIGGER %s_delete AFTER DELETE ON %s BEGIN \
+            INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s); END"
+            % (fts, table, fts, fts, columns, old)
+        )
+        # status-changes don't touch the index
+        db_handler.sql(
+            "CREATE TRIGGER %s_update AFTER UPDATE OF %s ON %s BEGIN \
+            INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s); \
+            INSERT INTO %s (rowid, %s) VALUES (new.id, %s); END"
+            % (fts, columns, table, fts, fts, columns, old, fts, columns, new)
+        )
+        db_handler.sql(
+            "INSERT INTO %s (%s) VALUES ('rebuild')" % (fts, fts))
+
+def _migration_8(db_handler):
+    """display_title: the title through makePrintable, written with
+    the title, so listing doesn't sanitize again
+    """
+    db_handler.conn.create_function('printable', 1, _printable)
+    for table in ('shows', 'casts'):
+        db_handler.sql('ALTER TABLE %s ADD COLUMN display_title TEXT' % table)
+        db_handler.sql(
+            'UPDATE %s SET display_title=printable(title)' % table)
+
+def _printable(title):
+    if title is None:
+        return None
+    return makePrintable(title)
+
+#columns of the full-text index, see _migration_7
+FULLTEXT_TABLES = (
+    ('shows', ('title', 'subtitle', 'author')),
+    ('casts', ('title',)),
+)
+
+MIGRATIONS = [
+    _migration_1, _migration_2, _migration_3, _migration_4, _migration_5,
+    _migration_6, _migration_7, _migration_8
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version():
+    with DB() as db_handler:
+        return db_handler.sql('PRAGMA user_version')[0][0]
+
+def migrate():
+    """bring the database up to SCHEMA_VERSION, every migration
+    inside its own transaction
+    """
+    if get_schema_version() >= SCHEMA_VERSION:
+        return
+    for version, migration in enumerate(MIGRATIONS, 1):
+        with transaction(), DB() as db_handler:
+            # another process may have migrated meanwhile
+            if db_handler.sql('PRAGMA user_version')[0][0] >= version:
+                continue
+            migration(db_handler)
+            db_handler.sql('PRAGMA user_version = %d' % version)
+
+def reset():
+    """drop all tables and create the current schema
+    """
+    with transaction(), DB() as db_handler:
+        for table in ('shows_fts', 'casts_fts', 'shows', 'casts',
+                      'media_dirs', 'media_files'):
+            db_handler.sql('DROP TABLE IF EXISTS %s' % table)
+        db_handler.sql('PRAGMA user_version = 0')
+    migrate()
 
 def get_cast_data(cast_id):
     with DB() as db_handler:
@@ -74,15 +227,103 @@ def get_cast_data(cast_id):
     else:
         raise KeyError("Cast with id %d doesn't exist." % cast_id)
 
-def get_ids_for_update(status):
-    sql_add = ''
-    if status == ST_UPDATE_WEEKLY:
-        pass
-
+def get_ids_for_update(status, now):
+    """ids of the casts with this status that are due at epoch now,
+    the most overdue (relative to their interval) first
+    """
     with DB() as db_handler:
         result = db_handler.sql(
-            'SELECT id from casts WHERE status = ?',
-            str(STATUS_UPDATE))
+            'SELECT id FROM casts WHERE status=? \
+            AND (next_update IS NULL OR next_update<=?) \
+            ORDER BY next_update IS NOT NULL, \
+            (? - next_update) * 1.0 / MAX(update_interval, 1) DESC',
+            (status, now, now)
+        )
+    return [row[0] for row in result]
+
+def set_next_update(cast_id, next_update, interval=None):
+    """schedule the next update of a cast, interval stays as it
+    is if None
+    """
+    with DB() as db_handler:
+        db_handler.sql(
+            'UPDATE casts SET next_update=?, \
+            update_interval=COALESCE(?, update_interval) WHERE id=?',
+            (next_update, interval, cast_id)
+        )
+
+def _fulltext_query(text):
+    """FTS5-query of the words in text: all of them must match,
+    each as prefix, 'pod ep' finds 'Podcast Episode'
+    """
+    words = re.findall(r'\w+', text, re.UNICODE)
+    return ' '.join('"%s"*' % word for word in words)
+
+def _like_terms(text, columns):
+    """where-clause and parameters for the LIKE-search without FTS5
+    """
+    words = re.findall(r'\w+', text, re.UNICODE)
+    clause = ' AND '.join(
+        '(%s)' % ' OR '.join('%s LIKE ?' % column for column in columns)
+        for word in words
+    )
+    parameters = [
+        '%%%s%%' % word for word in words for column in columns
+    ]
+    return clause, parameters
+
+def search_shows(text, limit=20):
+    """(id, feed_id, cast-title, title, published, status) of the
+    shows whose title, subtitle or author contain all words of text,
+    best matches first (title counts most). Titles are the display_title.
+    """
+    query = _fulltext_query(text)
+    if not query:
+        return []
+    with DB() as db_handler:
+        try:
+            return db_handler.sql(
+                "SELECT S.id, S.feed_id, C.display_title, S.display_title, \
+                S.published, S.status FROM shows_fts JOIN shows AS S ON S.id=shows_fts.rowid \
+                LEFT JOIN casts AS C ON C.id=S.feed_id \
+                WHERE shows_fts MATCH ? \
+                ORDER BY bm25(shows_fts, 10.0, 3.0, 1.0) LIMIT ?",
+                (query, limit)
+            )
+        except sqlite3.OperationalError:
+            # no FTS5, a full scan
+            clause, parameters = _like_terms(
+                text, ('S.title', 'S.subtitle', 'S.author'))
+            return db_handler.sql(
+                "SELECT S.id, S.feed_id, C.display_title, S.display_title, \
+                S.published, S.status FROM shows AS S LEFT JOIN casts AS C \
+                ON C.id=S.feed_id WHERE %s \
+                ORDER BY S.published DESC LIMIT ?" % clause,
+                parameters + [limit]
+            )
+
+def search_casts(text, limit=20):
+    """(id, display_title) of the casts whose title contains all
+    words of text, best matches first
+    """
+    query = _fulltext_query(text)
+    if not query:
+        return []
+    with DB() as db_handler:
+        try:
+            return db_handler.sql(
+                "SELECT C.id, C.display_title FROM casts_fts \
+                JOIN casts AS C ON C.id=casts_fts.rowid \
+                WHERE casts_fts MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit)
+            )
+        except sqlite3.OperationalError:
+            clause, parameters = _like_terms(text, ('C.title',))
+            return db_handler.sql(
+                "SELECT C.id, C.display_title FROM casts AS C WHERE %s \
+                ORDER BY C.id LIMIT ?" % clause,
+                parameters + [limit]
+            )
 
 def change_feed_url(cast_id, new_url):
     with DB() as db_handler:
@@ -0,0 +1,303 @@
+"""Download of media-files via http.
+
+A download is streamed into '<file>.part' and renamed to '<file>'
+when it is complete. Next to it '<file>.part.json' remembers url,
+expected size and validator of the download, so an interrupted
+download is continued with a Range-request on the next run instead
+of starting from zero.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib2
+
+import httppool
+
+PART_SUFFIX = '.part'
+INFO_SUFFIX = '.part.json'
+
+
+def progressReport(bytesSoFar, chunkSize, totalSize):
+    """Write download-progress to stdout. totalSize is None if
+    the server didn't tell the size.
+    """
+    if not totalSize:
+        sys.stdout.write("Downloaded %d bytes\r" % bytesSoFar)
+        return
+    percent = float(bytesSoFar) / totalSize
+    percent = round(percent*100, 2)
+    sys.stdout.write(
+        "Downloaded %d of %d bytes (%0.2f%%)\r" %
+        (bytesSoFar, totalSize, percent)
+    )
+    if bytesSoFar >= totalSize:
+        sys.stdout.write('\nready.\n')
+
+def downloadAudio(url, path, chunkSize=32768, progress=progressReport):
+    """Download audio-data via http and stream it to path.
+    Resumes a previous partial download of the same url if the
+    server supports ranges. Returns the size of the file.
+    """
+    partPath = path + PART_SUFFIX
+    info = _readPartInfo(path, url)
+    offset = 0
+    headers = {}
+    if info and os.path.exists(partPath):
+        offset = os.path.getsize(partPath)
+        validator = _getValidator(info)
+        if offset and validator:
+            headers['Range'] = 'bytes=%d-' % offset
+            headers['If-Range'] = validator
+        else:
+            offset = 0
+
+    try:
+        # no compression, Range counts bytes of the file
+        response = httppool.urlopen(url, headers, decode=False)
+    except urllib2.HTTPError as e:
+        if e.code != 416 or not offset:
+            raise
+        if offset == info.get('size'):
+            # the part-file was complete already
+            _finishPart(path)
+            return offset
+        _removePart(path)
+        return downloadAudio(url, path, chunkSize, progress)
+
+    responseInfo = response.info()
+    resumed = (offset and response.getcode() == 206
+               and _getRangeStart(responseInfo) == offset)
+    if resumed:
+        totalSize = _getRangeTotal(responseInfo) or info.get('size')
+        info = {
+            'url': url,
+            'size': totalSize,
+            'etag': responseInfo.getheader('ETag') or info.get('etag'),
+            'last_modified': responseInfo.getheader('Last-Modified')
+                or info.get('last_modified')
+        }
+    else:
+        offset = 0
+        totalSize = responseInfo.getheader('Content-Length')
+        if totalSize:
+            totalSize = int(totalSize.strip())
+        info = {
+            'url': url,
+            'size': totalSize,
+            'etag': responseInfo.getheader('ETag'),
+            'last_modified': responseInfo.getheader('Last-Modified')
+        }
+    _writePartInfo(path, info)
+
+    bytesSoFar = offset
+    try:
+        with open(partPath, 'ab' if resumed else 'wb') as fh:
+            while 1:
+                chunk = response.read(chunkSize)
+                if not chunk:
+                    break
+                fh.write(chunk)
+                bytesSoFar += len(chunk)
+                progress(bytesSoFar, chunkSize, totalSize)
+    finally:
+        response.close()
+    if totalSize and bytesSoFar < totalSize:
+        # keep the part-file, the next run continues from here
+        raise IOError("Download incomplete (%d of %d bytes): %s" % (
+            bytesSoFar, totalSize, url))
+    if not totalSize:
+        progress(bytesSoFar, chunkSize, bytesSoFar)
+    _finishPart(path)
+    return bytesSoFar
+
+def _getValidator(info):
+    """return the value for an If-Range header or None. Weak
+    ETags are not allowed there.
+    """
+    etag = info.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return info.get('last_modified')
+
+def _getRangeStart(headers):
+    """first byte of a 'Content-Range: bytes 100-199/200' header
+    """
+    contentRange = headers.getheader('Content-Range', '')
+    try:
+        return int(contentRange.split()[1].split('-')[0])
+    except (IndexError, ValueError):
+        return None
+
+def _getRangeTotal(headers):
+    """complete size from a 'Content-Range: bytes 100-199/200' header
+    """
+    contentRange = headers.getheader('Content-Range', '')
+    try:
+        return int(contentRange.split('/')[1])
+    except (IndexError, ValueError):
+        return None
+
+def _readPartInfo(path, url):
+    """return the stored info of a partial download of url to path
+    or None if there is none (or it belongs to another url)
+    """
+    try:
+        with open(path + INFO_SUFFIX) as fh:
+            info = json.load(fh)
+    except (IOError, ValueError):
+        return None
+    if info.get('url') != url:
+        return None
+    return info
+
+def _writePartInfo(path, info):
+    with open(path + INFO_SUFFIX, 'w') as fh:
+        json.dump(info, fh)
+
+def _finishPart(path):
+    """move the completed part-file into place
+    """
+    if os.name == 'nt' and os.path.exists(path):
+        # windows can't rename onto an existing file
+        os.remove(path)
+    os.rename(path + PART_SUFFIX, path)
+    if os.path.exists(path + INFO_SUFFIX):
+        os.remove(path + INFO_SUFFIX)
+
+def _removePart(path):
+    for suffix in (PART_SUFFIX, INFO_SUFFIX):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class DownloadManager(object):
+    """Run download-jobs in a pool of worker-threads. At most 'jobs'
+    downloads run at the same time and at most 'perHost' of them
+    from the same host. Jobs start in the order they were added.
+
+    manager = DownloadManager(jobs=4, perHost=2)
+    manager.add(host, label, func)  # func(progress) downloads
+    done, failed = manager.run()
+    """
+    def __init__(self, jobs=4, perHost=2):
+        self.jobs = max(1, jobs)
+        self.perHost = max(1, perHost)
+        self.pending = []
+        self.running = {}
+        self.done = []
+        self.failed = []
+        self.condition = threading.Condition()
+        self.board = None
+
+    def add(self, host, label, func):
+        self.pending.append((host, label, func))
+
+    def run(self):
+        """download everything and return the labels of the
+        finished and a list of (label, error) of the failed jobs
+        """
+        self.board = _ProgressBoard(len(self.pending))
+        workers = []
+        for i in range(min(self.jobs, len(self.pending))):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            # joining with a timeout keeps ctrl-c working
+            while worker.is_alive():
+                worker.join(0.5)
+        self.board.close()
+        return self.done, self.failed
+
+    def _nextJob(self):
+        """take the first pending job whose host has a free slot,
+        wait if there is none. Returns None when all are taken.
+        """
+        with self.condition:
+            while self.pending:
+                for index, (host, label, func) in enumerate(self.pending):
+                    if self.running.get(host, 0) < self.perHost:
+                        self.running[host] = self.running.get(host, 0) + 1
+                        return self.pending.pop(index)
+                self.condition.wait()
+            return None
+
+    def _work(self):
+        while True:
+            job = self._nextJob()
+            if job is None:
+                return
+            host, label, func = job
+            key = self.board.start(label)
+            try:
+                func(self.board.reporter(key))
+            except Exception as e:
+                self.failed.append((label, e))
+                self.board.finish(key, failed=True)
+            else:
+                self.done.append(label)
+                self.board.finish(key)
+            finally:
+                with self.condition:
+                    self.running[host] -= 1
+                    self.condition.notify_all()
+
+
+class _ProgressBoard(object):
+    """one summary line for all running downloads instead of one
+    progress line per download
+    """
+    def __init__(self, total, interval=0.2):
+        self.total = total
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.finished = 0
+        self.failed = 0
+        self.bytesDone = 0
+        self.nextKey = 0
+        self.lastDraw = 0
+
+    def start(self, label):
+        with self.lock:
+            key = self.nextKey
+            self.nextKey += 1
+            self.active[key] = [label, 0, None]
+            self._draw()
+        return key
+
+    def reporter(self, key):
+        """return a progress-callback as downloadAudio expects it
+        """
+        def report(bytesSoFar, chunkSize, totalSize):
+            with self.lock:
+                self.active[key][1:] = [bytesSoFar, totalSize]
+                if time.time() - self.lastDraw >= self.interval:
+                    self._draw()
+        return report
+
+    def finish(self, key, failed=False):
+        with self.lock:
+            label, bytesSoFar, totalSize = self.active.pop(key)
+            self.bytesDone += bytesSoFar
+            self.finished += 1
+            if failed:
+                self.failed += 1
+            self._draw()
+
+    def close(self):
+        sys.stdout.write('\n')
+
+    def _draw(self):
+        loaded = self.bytesDone + sum(a[1] for a in self.active.values())
+        line = "%d of %d done, %d running, %d failed, %0.1f MB" % (
+            self.finished, self.total, len(self.active), self.failed,
+            loaded / 1048576.0
+        )
+        sys.stdout.write("\r%-79s" % line)
+        sys.stdout.flush()
+        self.lastDraw = time.time()
@@ -1,35 +1,202 @@
 """Some helper classes
 """
 
+import atexit
+import json
+import logging
+import os
 import os.path
+import Queue
+import re
 import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 LOG_PATH = "logs/"
+#json-lines, rotated to podcatcher.log.1 ... when bigger than LOG_MAX_BYTES
+LOG_FILE = "podcatcher.log"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
 DB_PATH = "C:/Daten/Projekte/Python-Projekte/podcatcher/src/database.sq3"
 
-class Logger(object):
-    """Simple notes- and errors-logger
+#everything podcatcher tells goes through this logger. Messages for
+#the user are INFO, chatter DEBUG, problems WARNING and above.
+logger = logging.getLogger('podcatcher')
+logger.addHandler(logging.NullHandler())
+#listings (status, search) go only to the console, not to LOG_FILE
+output = logging.getLogger('podcatcher.output')
+output.propagate = False
+output.addHandler(logging.NullHandler())
+
+_console = None
+_logWriter = None
+
+def setupLogging(consoleLevel=logging.INFO, fileLevel=logging.INFO):
+    """send the log to stdout (plain messages) and to LOG_FILE
+    inside LOG_PATH (json-lines, written by a background-thread).
+    Calling it again only changes the levels.
     """
-    def __init__(self):
-        logpath = os.path.join(LOG_PATH, "logs.txt")
-        self.fileHandler = open(logpath,"a")
-    
-    def __enter__(self):
-        return self
+    global _console, _logWriter
+    logger.setLevel(min(consoleLevel, fileLevel))
+    output.setLevel(consoleLevel)
+    if _logWriter is not None:
+        _console.setLevel(consoleLevel)
+        _logWriter.handler.setLevel(fileLevel)
+        return
+    _console = logging.StreamHandler(sys.stdout)
+    _console.setFormatter(logging.Formatter('%(message)s'))
+    _console.setLevel(consoleLevel)
+    logger.addHandler(_console)
+    output.addHandler(_console)
+    if not os.path.isdir(LOG_PATH):
+        os.makedirs(LOG_PATH)
+    _logWriter = _LogWriter(
+        os.path.join(LOG_PATH, LOG_FILE), LOG_MAX_BYTES, LOG_BACKUPS
+    )
+    _logWriter.handler.setLevel(fileLevel)
+    logger.addHandler(_logWriter.handler)
+    _logWriter.start()
+    atexit.register(shutdownLogging)
 
-    def __exit__(self, type, value, traceback):
-        self.fileHandler.close()
+def shutdownLogging():
+    """write what is queued and stop the log-writer
+    """
+    global _console, _logWriter
+    if _logWriter is None:
+        return
+    logger.removeHandler(_logWriter.handler)
+    logger.removeHandler(_console)
+    output.removeHandler(_console)
+    _logWriter.stop()
+    _console = _logWriter = None
+
+
+class _QueueHandler(logging.Handler):
+    """formats records as json in the logging thread and queues
+    them, the file is written by the _LogWriter-thread
+    """
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            data = {
+                'time': datetime.fromtimestamp(record.created).isoformat(),
+                'level': record.levelname,
+                'thread': record.threadName,
+                'message': record.getMessage(),
+            }
+            if record.exc_info:
+                data['exception'] = logging.Formatter().formatException(
+                    record.exc_info)
+            self.queue.put(json.dumps(data) + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+class _LogWriter(threading.Thread):
+    """background-thread writing queued lines to a size-rotated file
+    """
+    def __init__(self, path, maxBytes, backups):
+        threading.Thread.__init__(self, name='log-writer')
+        self.daemon = True
+        self.path = path
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.queue = Queue.Queue()
+        self.handler = _QueueHandler(self.queue)
+
+    def run(self):
+        fh = open(self.path, 'a')
+        fh.seek(0, os.SEEK_END)
+        try:
+            while True:
+                lines = [self.queue.get()]
+                # write all that piled up at once
+                while lines[-1] is not None:
+                    try:
+                        lines.append(self.queue.get_nowait())
+                    except Queue.Empty:
+                        break
+                stop = lines[-1] is None
+                for line in lines:
+                    if line is None:
+                        continue
+                    if self.maxBytes and fh.tell() + len(line) > self.maxBytes:
+                        fh = self._rotate(fh)
+                    fh.write(line)
+                fh.flush()
+                if stop:
+                    return
+        finally:
+            fh.close()
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def _rotate(self, fh):
+        fh.close()
+        for number in range(self.backups - 1, 0, -1):
+            older = '%s.%d' % (self.path, number)
+            if os.path.exists(older):
+                if os.path.exists('%s.%d' % (self.path, number + 1)):
+                    os.remove('%s.%d' % (self.path, number + 1))
+                os.rename(older, '%s.%d' % (self.path, number + 1))
+        if self.backups:
+            if os.path.exists(self.path + '.1'):
+                os.remove(self.path + '.1')
+            os.rename(self.path, self.path + '.1')
+        return open(self.path, 'w')
+
+_local = threading.local()
 
-    def write(self, data):
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.fileHandler.write("%s:\t%s\n" % (now,data))
+#statements run by all DB-objects, see getStatementCount
+_statementCount = 0
+_statementLock = threading.Lock()
+
+def getStatementCount():
+    """number of sql-statements executed so far by this process
+    (an executemany counts once)
+    """
+    return _statementCount
+
+def getThreadStatementCount():
+    """number of sql-statements executed so far by this thread
+    """
+    return getattr(_local, 'statements', 0)
+
+def _countStatement():
+    global _statementCount
+    with _statementLock:
+        _statementCount += 1
+    _local.statements = getattr(_local, 'statements', 0) + 1
+
+def _getConnection(filepath):
+    """return the sqlite3-connection of this thread to filepath.
+    Every thread keeps one open connection per database-file.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+        _local.depth = {}
+    conn = connections.get(filepath)
+    if conn is None:
+        # autocommit, transactions are opened explicitly
+        conn = sqlite3.connect(filepath, timeout=30, isolation_level=None)
+        connections[filepath] = conn
+    return conn
 
 class DB(object):
-    """simple handler of sqlite3 queries.
+    """simple handler of sqlite3 queries. All DB-objects of a
+    thread share its connection. A statement is committed at once,
+    unless it runs inside a 'with transaction()'-block.
     """
-    def __init__(self,filepath=DB_PATH):
-        self.conn = sqlite3.connect(filepath)
+    def __init__(self, filepath=None):
+        self.conn = _getConnection(filepath or DB_PATH)
         self.cursor = self.conn.cursor()
 
     def __enter__(self):
@@ -38,9 +205,10 @@ class DB(object):
         return self
 
     def __exit__(self, type, value, traceback):
-        """called after with-stamement block.
+        """called after with-stamement block. The connection
+        stays open for the next DB-object of this thread.
         """
-        self.conn.close()
+        self.cursor.close()
 
     def getLastId(self):
         return self.cursor.lastrowid
@@ -48,11 +216,64 @@ class DB(object):
     def sql(self, sql, parameters=()):
         """execute query and return result if present.
         """
+        _countStatement()
         self.cursor.execute(sql,parameters)
-        self.conn.commit()
         return self.cursor.fetchall()
 
+    def iterate(self, sql, parameters=()):
+        """execute query and yield its rows one by one as sqlite
+        steps through them, without loading all of them. Use it
+        inside the with-block, leaving it closes the cursor.
+        """
+        _countStatement()
+        self.cursor.execute(sql, parameters)
+        for row in self.cursor:
+            yield row
 
-def log(message):
-    with Logger() as l:
-        l.write(message)        
\ No newline at end of file
+    def sqlmany(self, sql, seqOfParameters):
+        """execute query once for every tuple of parameters.
+        """
+        _countStatement()
+        self.cursor.executemany(sql, seqOfParameters)
+
+@contextmanager
+def transaction(filepath=None):
+    """Run all statements of this thread inside the with-block
+    as one transaction: commit at the end, rollback on exceptions.
+    Nested blocks become part of the outer transaction.
+    """
+    filepath = filepath or DB_PATH
+    conn = _getConnection(filepath)
+    depth = _local.depth.get(filepath, 0)
+    if not depth:
+        # take the write-lock now instead of failing halfway
+        conn.execute("BEGIN IMMEDIATE")
+    _local.depth[filepath] = depth + 1
+    try:
+        yield
+    except:
+        _local.depth[filepath] = depth
+        if not depth:
+            conn.execute("ROLLBACK")
+        raise
+    else:
+        _local.depth[filepath] = depth
+        if not depth:
+            conn.execute("COMMIT")
+
+
+#everything but ascii-letters, digits, _ []:@~/ the range ' ' to '.'
+#and the german umlauts
+_UNPRINTABLE = re.compile(
+    u"[^\\[\\]a-zA-Z0-9_ -.:@~/\u00e4\u00f6\u00fc\u00c4\u00d6\u00dc\u00df]"
+)
+
+def makePrintable(unprintable):
+    """change unprintable characters into '{?}'
+    """
+    return _UNPRINTABLE.sub(u'{?}', unprintable)
+
+def log(message, level=logging.WARNING):
+    """write message to the log
+    """
+    logger.log(level, message)        
\ No newline at end of file
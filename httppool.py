@@ -0,0 +1,318 @@
+"""Shared http-client with persistent connections.
+
+Many feeds and their media live on the same few hosting platforms.
+Instead of a new TCP (and TLS) connection per request, finished
+connections are kept open per (scheme, host, port) and used again
+by the next request to that host, from any thread. Host names are
+resolved once per DNS_TTL. gzip and deflate bodies are decoded while
+reading.
+
+urlopen() behaves like urllib2.urlopen (HTTPError for everything that
+isn't 2xx), fetch() reads a whole response like asyncfetch does.
+"""
+
+import collections
+import httplib
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+from cStringIO import StringIO
+
+USER_AGENT = 'Fussels Podcatcher'
+TIMEOUT = 5
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+#idle connections kept per host
+MAX_IDLE_PER_HOST = 4
+#idle connections older than this (seconds) are not used again
+MAX_IDLE_TIME = 30
+#seconds a resolved host name is trusted
+DNS_TTL = 300
+
+
+class Response(object):
+    """completely read response of fetch(), same fields as
+    asyncfetch.Response
+    """
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.headers = {}
+        self.body = ''
+        self.error = None
+
+
+class PooledResponse(object):
+    """file-like response as urllib2.urlopen returns it. Closing
+    it after the body was read completely hands the connection back
+    to the pool.
+    """
+    def __init__(self, pool, key, conn, response, url, decode):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.decompressor = None
+        encoding = response.getheader('Content-Encoding', '').lower()
+        if decode and encoding in ('gzip', 'x-gzip'):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif decode and encoding == 'deflate':
+            self.decompressor = _DeflateDecoder()
+        self.buffer = ''
+
+    def getcode(self):
+        return self.response.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.response.msg
+
+    def read(self, size=-1):
+        if self.decompressor is None:
+            if size < 0:
+                return self.response.read()
+            return self.response.read(size)
+        while size < 0 or len(self.buffer) < size:
+            chunk = self.response.read(65536)
+            if not chunk:
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(chunk)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool._release(self.key, conn)
+        else:
+            # unread data or 'Connection: close'
+            conn.close()
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class HTTPPool(object):
+    """thread-safe pool of keep-alive connections per host
+    """
+    def __init__(self, timeout=TIMEOUT, maxIdlePerHost=MAX_IDLE_PER_HOST):
+        self.timeout = timeout
+        self.maxIdlePerHost = maxIdlePerHost
+        self.lock = threading.Lock()
+        self.idle = collections.defaultdict(list)
+
+    def urlopen(self, url, headers=None, decode=True):
+        """GET url and return a PooledResponse, following redirects.
+        With decode a compressed body is asked for and decoded while
+        reading (don't use it together with Range-requests).
+        Raises urllib2.HTTPError if the final status isn't 2xx.
+        """
+        response = self._open(url, headers, decode)
+        status = response.getcode()
+        if not 200 <= status < 300:
+            with response:
+                body = response.read()
+            raise urllib2.HTTPError(
+                response.geturl(), status, response.response.reason,
+                response.info(), StringIO(body)
+            )
+        return response
+
+    def fetch(self, url, headers=None):
+        """GET url and return a completely read Response. Other
+        than urlopen() no error is raised for http-status codes.
+        """
+        result = Response(url)
+        with self._open(url, headers, True) as response:
+            result.url = response.geturl()
+            result.status = response.getcode()
+            result.headers = dict(response.info().items())
+            result.body = response.read()
+        # the body is decoded already
+        result.headers.pop('content-encoding', None)
+        return result
+
+    def closeAll(self):
+        with self.lock:
+            idle = self.idle.values()
+            self.idle.clear()
+        for connections in idle:
+            for conn, since in connections:
+                conn.close()
+
+    def _open(self, url, headers, decode):
+        """request url and follow redirects
+        """
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', USER_AGENT)
+        headers['Accept-Encoding'] = 'gzip, deflate' if decode else 'identity'
+        for i in range(MAX_REDIRECTS + 1):
+            response = self._request(url, headers, decode)
+            location = response.info().getheader('Location')
+            if response.getcode() not in REDIRECT_CODES or not location:
+                break
+            # drain the body, so the connection can be used again
+            with response:
+                response.read()
+            url = urlparse.urljoin(url, location)
+        return response
+
+    def _request(self, url, headers, decode):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError("unsupported url: %s" % url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        conn = self._acquire(key)
+        if conn is not None:
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                # the server closed the idle connection meanwhile
+                conn.close()
+                conn = None
+        if conn is None:
+            conn = self._connect(key)
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+            except:
+                conn.close()
+                raise
+        return PooledResponse(self, key, conn, response, url, decode)
+
+    def _acquire(self, key):
+        """an idle connection to key or None
+        """
+        with self.lock:
+            connections = self.idle.get(key)
+            while connections:
+                conn, since = connections.pop()
+                if time.time() - since < MAX_IDLE_TIME:
+                    return conn
+                conn.close()
+        return None
+
+    def _release(self, key, conn):
+        with self.lock:
+            connections = self.idle[key]
+            if len(connections) < self.maxIdlePerHost:
+                connections.append((conn, time.time()))
+                return
+        conn.close()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return _HTTPSConnection(host, port, timeout=self.timeout)
+        return _HTTPConnection(host, port, timeout=self.timeout)
+
+
+class _HTTPConnection(httplib.HTTPConnection):
+    def connect(self):
+        self.sock = _createConnection(self.host, self.port, self.timeout)
+
+
+class _HTTPSConnection(httplib.HTTPSConnection):
+    def connect(self):
+        sock = _createConnection(self.host, self.port, self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+_dnsCache = {}
+_dnsLock = threading.Lock()
+
+def resolve(host, port):
+    """getaddrinfo of (host, port), cached for DNS_TTL seconds
+    """
+    with _dnsLock:
+        cached = _dnsCache.get((host, port))
+    if cached and time.time() - cached[0] < DNS_TTL:
+        return cached[1]
+    addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    with _dnsLock:
+        _dnsCache[(host, port)] = (time.time(), addresses)
+    return addresses
+
+def _createConnection(host, port, timeout):
+    """like socket.create_connection, with cached name resolution
+    """
+    error = None
+    for family, socktype, proto, _, address in resolve(host, port):
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+        except socket.error as e:
+            sock.close()
+            error = e
+            continue
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    raise error or socket.error("can't resolve %s" % host)
+
+
+class _DeflateDecoder(object):
+    """'deflate' is zlib-wrapped by the standard, raw by some
+    servers. Decide on the first chunk.
+    """
+    def __init__(self):
+        self.decompressor = None
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            self.decompressor = zlib.decompressobj()
+            try:
+                return self.decompressor.decompress(data)
+            except zlib.error:
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        if self.decompressor is None:
+            return ''
+        return self.decompressor.flush()
+
+
+_pool = HTTPPool()
+
+def urlopen(url, headers=None, decode=True):
+    """urlopen() of the shared pool
+    """
+    return _pool.urlopen(url, headers, decode)
+
+def fetch(url, headers=None):
+    """fetch() of the shared pool
+    """
+    return _pool.fetch(url, headers)
+
+def getConditionalHeaders(etag, modified):
+    """request-headers for a conditional GET with the stored
+    ETag and Last-Modified of a feed, each may be None
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+    return headers
@@ -0,0 +1,348 @@
+"""Index of the files below MEDIA_PATH inside the database.
+
+Listing a directory with tens of thousands of files on a NAS takes
+seconds, so podcatcher asks the tables media_dirs and media_files
+instead. Downloads are added as they complete. rescan() brings the
+index in line with the disk, but only lists directories whose mtime
+changed since the last scan.
+
+Files also carry the sha256 of their content on disk, taken after
+tagging (or by dedupe). It is dropped when size or mtime change.
+Equal content is stored once, the other paths become hard-links to
+it.
+"""
+
+import hashlib
+import os
+import stat as statmode
+import sys
+from multiprocessing.pool import ThreadPool
+
+from helper import DB, transaction, logger
+
+#leftovers of running or broken downloads
+IGNORED_SUFFIXES = ('.part', '.part.json', '.tmp')
+
+_indexes = {}
+
+
+def getIndex(root):
+    """return the MediaIndex of root. An empty index is filled by a
+    first scan, so existing libraries are not downloaded again.
+    """
+    index = _indexes.get(root)
+    if index is None:
+        index = _indexes[root] = MediaIndex(root)
+        if index.isEmpty():
+            index.rescan()
+    return index
+
+
+class MediaIndex(object):
+    """files and directories below root, by relative path with '/'
+    """
+    def __init__(self, root):
+        if not isinstance(root, unicode):
+            # unicode in, unicode names out of os.listdir
+            root = root.decode(sys.getfilesystemencoding() or 'utf-8')
+        self.root = root
+
+    def isEmpty(self):
+        with DB() as dbHandler:
+            return not dbHandler.sql("SELECT 1 FROM media_dirs LIMIT 1")
+
+    def hasDir(self, relDir):
+        """True if relDir is inside the index and still on disk.
+        Costs one stat, a vanished directory is dropped.
+        """
+        with DB() as dbHandler:
+            if not dbHandler.sql(
+                "SELECT 1 FROM media_dirs WHERE path=?", (relDir,)
+            ):
+                return False
+            if os.path.isdir(self._absPath(relDir)):
+                return True
+            self._dropDir(dbHandler, relDir)
+            return False
+
+    def makeDir(self, relDir):
+        """create the directory (if missing) and add it to the index
+        """
+        path = self._absPath(relDir)
+        try:
+            os.mkdir(path)
+        except OSError:
+            # a parallel download may have been faster
+            if not os.path.isdir(path):
+                raise
+        with DB() as dbHandler:
+            # mtime 0, so the next rescan looks inside
+            dbHandler.sql(
+                "INSERT OR IGNORE INTO media_dirs VALUES (?,?,?)",
+                (relDir, _parent(relDir), 0)
+            )
+
+    def hasFile(self, relPath):
+        """True if relPath was downloaded completely: it is inside
+        the index, has content and isn't shorter than announced
+        by the server. Costs one stat, no directory listing.
+        """
+        with DB() as dbHandler:
+            result = dbHandler.sql(
+                "SELECT size, expected_size FROM media_files WHERE path=?",
+                (relPath,)
+            )
+        if not result:
+            return False
+        size, expected = result[0]
+        if not size or (expected and size < expected):
+            return False
+        try:
+            return os.path.getsize(self._absPath(relPath)) > 0
+        except OSError:
+            self.removeFile(relPath)
+            return False
+
+    def addFile(self, relPath, expectedSize=None, checksum=None):
+        """add (or refresh) a completed file. If checksum is None, a
+        known one is kept as long as size and mtime are unchanged.
+        """
+        stat = os.stat(self._absPath(relPath))
+        with DB() as dbHandler:
+            dbHandler.sql(
+                "INSERT OR REPLACE INTO media_files \
+                (path, dir, size, mtime, expected_size, sha256) \
+                VALUES (?,?,?,?,?, COALESCE(?, \
+                    (SELECT sha256 FROM media_files \
+                    WHERE path=? AND size=? AND mtime=?)))",
+                (relPath, _parent(relPath), stat.st_size, stat.st_mtime,
+                 expectedSize, checksum, relPath, stat.st_size, stat.st_mtime)
+            )
+
+    def addUnique(self, relPath, expectedSize=None):
+        """hash a completed (and tagged) file and add it, as hard-link
+        to an indexed file with the same content if there is one.
+        Returns the path of that file or None.
+        """
+        checksum = hashFile(self._absPath(relPath))
+        sameContent = self.findContent(checksum, relPath)
+        if sameContent and not self.linkFile(sameContent, relPath):
+            sameContent = None
+        self.addFile(relPath, expectedSize, checksum)
+        return sameContent
+
+    def findContent(self, checksum, exclude=None):
+        """relative path of an existing file with this checksum
+        (other than exclude) or None
+        """
+        with DB() as dbHandler:
+            result = dbHandler.sql(
+                "SELECT path FROM media_files WHERE sha256=? AND path<>?",
+                (checksum, exclude or '')
+            )
+        for row in result:
+            if os.path.isfile(self._absPath(row[0])):
+                return row[0]
+        return None
+
+    def linkFile(self, sourcePath, relPath):
+        """replace relPath by a hard-link to sourcePath. Returns False
+        if the filesystem can't (then relPath stays a copy).
+        """
+        source = self._absPath(sourcePath)
+        target = self._absPath(relPath)
+        if not hasattr(os, 'link'):
+            # python 2 has no hard-links on windows
+            return False
+        tmpPath = target + '.tmp'
+        try:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            os.link(source, tmpPath)
+        except OSError as e:
+            logger.debug("Can't link %s to %s (%s)", relPath, sourcePath, e)
+            return False
+        os.rename(tmpPath, target)
+        return True
+
+    def removeFile(self, relPath):
+        with DB() as dbHandler:
+            dbHandler.sql(
+                "DELETE FROM media_files WHERE path=?", (relPath,)
+            )
+
+    def rescan(self):
+        """bring the index in line with the disk. Returns the
+        number of (listed directories, changed files).
+        """
+        stats = [0, 0]
+        with transaction(), DB() as dbHandler:
+            self._scanDir(dbHandler, '', stats)
+        return tuple(stats)
+
+    def _scanDir(self, dbHandler, relDir, stats):
+        try:
+            mtime = os.stat(self._absPath(relDir)).st_mtime
+        except OSError:
+            self._dropDir(dbHandler, relDir)
+            return
+        known = dbHandler.sql(
+            "SELECT mtime FROM media_dirs WHERE path=?", (relDir,)
+        )
+        if known and known[0][0] == mtime:
+            children = [row[0] for row in dbHandler.sql(
+                "SELECT path FROM media_dirs WHERE parent=? AND path<>''",
+                (relDir,)
+            )]
+        else:
+            children = self._listDir(dbHandler, relDir, stats)
+            dbHandler.sql(
+                "INSERT OR REPLACE INTO media_dirs VALUES (?,?,?)",
+                (relDir, _parent(relDir), mtime)
+            )
+        for child in children:
+            self._scanDir(dbHandler, child, stats)
+
+    def _listDir(self, dbHandler, relDir, stats):
+        """read one changed directory, update its files and return
+        its subdirectories
+        """
+        stats[0] += 1
+        absDir = self._absPath(relDir)
+        known = dict(
+            (row[0], row[1:]) for row in dbHandler.sql(
+                "SELECT path, size, mtime FROM media_files WHERE dir=?",
+                (relDir,)
+            )
+        )
+        knownDirs = set(row[0] for row in dbHandler.sql(
+            "SELECT path FROM media_dirs WHERE parent=? AND path<>''",
+            (relDir,)
+        ))
+        children = []
+        for name in os.listdir(absDir):
+            # undecodable names come back as str, they can't be stored
+            if not isinstance(name, unicode) or name.endswith(IGNORED_SUFFIXES):
+                continue
+            relPath = _join(relDir, name)
+            try:
+                stat = os.stat(os.path.join(absDir, name))
+            except OSError:
+                continue
+            if statmode.S_ISDIR(stat.st_mode):
+                children.append(relPath)
+                continue
+            if known.pop(relPath, None) != (stat.st_size, stat.st_mtime):
+                stats[1] += 1
+                # changed content, the checksum is unknown again
+                dbHandler.sql(
+                    "INSERT OR REPLACE INTO media_files \
+                    (path, dir, size, mtime) VALUES (?,?,?,?)",
+                    (relPath, relDir, stat.st_size, stat.st_mtime)
+                )
+        for relPath in known:
+            stats[1] += 1
+            dbHandler.sql(
+                "DELETE FROM media_files WHERE path=?", (relPath,)
+            )
+        for gone in knownDirs.difference(children):
+            self._dropDir(dbHandler, gone)
+        return children
+
+    def dedupe(self, jobs=4, dryRun=False):
+        """hard-link all files with equal content to one of them.
+        Only files sharing their size with another one are hashed,
+        by 'jobs' threads. Returns (hashed files, linked files,
+        reclaimed bytes).
+        """
+        self.rescan()
+        with DB() as dbHandler:
+            unhashed = [row[0] for row in dbHandler.sql(
+                "SELECT path FROM media_files WHERE sha256 IS NULL \
+                AND size IN (SELECT size FROM media_files \
+                    GROUP BY size HAVING COUNT(*) > 1)"
+            )]
+        pool = ThreadPool(max(1, jobs))
+        try:
+            checksums = pool.map_async(self._hashPath, unhashed).get(2**31)
+        finally:
+            pool.terminate()
+            pool.join()
+        with transaction(), DB() as dbHandler:
+            dbHandler.sqlmany(
+                "UPDATE media_files SET sha256=? WHERE path=?",
+                [(checksum, path) for path, checksum
+                 in zip(unhashed, checksums) if checksum]
+            )
+            rows = dbHandler.sql(
+                "SELECT sha256, path, size, mtime FROM media_files \
+                WHERE sha256 IN (SELECT sha256 FROM media_files \
+                    WHERE sha256 IS NOT NULL \
+                    GROUP BY sha256 HAVING COUNT(*) > 1) \
+                ORDER BY sha256, path"
+            )
+        linked = reclaimed = 0
+        keep = None
+        for checksum, relPath, size, mtime in rows:
+            try:
+                stat = os.stat(self._absPath(relPath))
+            except OSError:
+                stat = None
+            if stat is not None and (stat.st_size, stat.st_mtime) != (
+                    size, mtime):
+                # changed since it was hashed
+                stat = None
+            if keep is None or keep[0] != checksum:
+                keep = (checksum, relPath, stat) if stat else None
+                continue
+            if stat is None:
+                continue
+            if (stat.st_dev, stat.st_ino) == (keep[2].st_dev, keep[2].st_ino):
+                continue
+            if dryRun or self.linkFile(keep[1], relPath):
+                linked += 1
+                reclaimed += stat.st_size
+                if not dryRun:
+                    self.addFile(relPath, None, checksum)
+        return len(unhashed), linked, reclaimed
+
+    def _hashPath(self, relPath):
+        try:
+            return hashFile(self._absPath(relPath))
+        except (IOError, OSError):
+            return None
+
+    def _dropDir(self, dbHandler, relDir):
+        """forget a vanished directory with everything below it
+        """
+        # everything starting with 'relDir/' sorts below 'relDir0'
+        below = (relDir, relDir + '/', relDir + '0')
+        dbHandler.sql(
+            "DELETE FROM media_files WHERE dir=? OR (dir>? AND dir<?)",
+            below
+        )
+        dbHandler.sql(
+            "DELETE FROM media_dirs WHERE path=? OR (path>? AND path<?)",
+            below
+        )
+
+    def _absPath(self, relPath):
+        return os.path.join(self.root, *relPath.split('/'))
+
+
+def hashFile(path, chunkSize=1048576):
+    """sha256 of the content of path as hex-string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        while True:
+            chunk = fh.read(chunkSize)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+def _join(relDir, name):
+    return relDir + '/' + name if relDir else name
+
+def _parent(relPath):
+    return relPath.rpartition('/')[0]
@@ -0,0 +1,111 @@
+"""Timings and counters of feed updates.
+
+Cast.update fills one CastMetrics per cast: seconds per phase
+
+    fetch   http-request of the feed (incl. name resolution)
+    parse   feedparser on the fetched body
+    posts   reading the entries into Posts (with --stream this
+            includes parsing, which happens while reading)
+    save    inserting the new posts
+    mark    _markOlderPosts and scheduling
+
+and the counters entries, new_posts, bytes and statements. After a
+run printSlowest() shows the slowest casts and writeJsonLines()
+appends one JSON object per cast to a file for cron-statistics.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+import helper
+from helper import logger
+
+PHASES = ('fetch', 'parse', 'posts', 'save', 'mark')
+
+
+class CastMetrics(object):
+    def __init__(self, feedId):
+        self.feedId = feedId
+        self.title = None
+        self.phases = {}
+        self.counts = {'entries': 0, 'new_posts': 0, 'bytes': None,
+                       'statements': 0}
+        self.unchanged = False
+        self.failed = False
+        self.started = time.time()
+        self.total = None
+        self._statementsAtStart = helper.getThreadStatementCount()
+
+    @contextmanager
+    def phase(self, name):
+        """add the time spent inside the with-block to phase name
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.time() - start
+
+    def count(self, name, number=1):
+        self.counts[name] = (self.counts.get(name) or 0) + number
+
+    def finish(self, failed=False):
+        """stop the clock, the statements of this thread since the
+        start are taken as the ones of this cast
+        """
+        if self.total is not None:
+            return
+        self.total = time.time() - self.started
+        self.failed = failed
+        self.counts['statements'] = (
+            helper.getThreadStatementCount() - self._statementsAtStart
+        )
+
+    def asDict(self):
+        data = {
+            'time': int(self.started),
+            'feed_id': self.feedId,
+            'title': self.title,
+            'total': round(self.total or 0, 4),
+            'phases': dict(
+                (name, round(seconds, 4))
+                for name, seconds in self.phases.items()
+            ),
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+        }
+        data.update(self.counts)
+        return data
+
+
+def printSlowest(metricsList, number=10):
+    """table of the 'number' casts that took longest
+    """
+    done = [m for m in metricsList if m.total is not None]
+    done.sort(key=lambda m: m.total, reverse=True)
+    logger.info("%-6s %-24s %7s %s %7s %5s %8s %5s",
+        'id', 'title', 'total', ' '.join('%7s' % p for p in PHASES),
+        'entries', 'new', 'kB', 'stmts')
+    for m in done[:number]:
+        size = m.counts.get('bytes')
+        logger.info("%-6s %-24s %7.3f %s %7d %5d %8s %5d",
+            m.feedId, (m.title or '')[:24], m.total,
+            ' '.join(
+                '%7.3f' % m.phases[p] if p in m.phases else '%7s' % '-'
+                for p in PHASES
+            ),
+            m.counts['entries'], m.counts['new_posts'],
+            '%d' % (size // 1024) if size is not None else '-',
+            m.counts['statements']
+        )
+
+def writeJsonLines(path, metricsList, run=None):
+    """append one line per cast to path, all with the same 'run'
+    """
+    run = run or int(time.time())
+    with open(path, 'a') as fh:
+        for m in metricsList:
+            data = m.asDict()
+            data['run'] = run
+            fh.write(json.dumps(data, sort_keys=True) + '\n')
@@ -12,27 +12,35 @@ status:      Development
 """
 
 # import sqlite3
-from datetime import date, datetime, timedelta
+from datetime import datetime, timedelta
 from hashlib import sha256
-from thread import start_new_thread, allocate_lock
-import urllib2
+from thread import allocate_lock
+from multiprocessing.pool import ThreadPool
+from functools import partial
 import time
+import logging
 import socket
 import sys
 import os
-import re
+import urlparse
 import argparse
-
-from mutagen.id3 import ID3, TXXX
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4
-from mutagen import File as mutagen_File
+from cStringIO import StringIO
 
 import feedparser
 import db
-
-from helper import log, DB
+import asyncfetch
+import httppool
+import mediaindex
+import tagging
+import streamfeed
+import scheduler
+from metrics import CastMetrics, printSlowest, writeJsonLines
+from dates import parseDate, formatEpoch, LEGACY_FORMAT
+
+from helper import (
+    log, logger, output, setupLogging, makePrintable, DB, transaction
+)
+from download import downloadAudio, progressReport, DownloadManager
 
 AUDIO_MIME_TYPES = [
 "audio/mpeg",
@@ -54,8 +62,26 @@ KNOWN_MIME_TYPES = [
 #set STATUS_OLDER_POST if post is > this days old
 DAYS_OLDER_POST = 14
 
-#minutes that should be between update-attempts
-UPDATE_TIME = 120   
+#minutes that should at least be between update-attempts of a cast
+UPDATE_TIME = 120
+
+#stop looking at a newest-first feed after this many known entries
+#in a row, unless updating with --full
+INCREMENTAL_KNOWN_RUN = 5
+
+#number of feeds that are fetched at the same time by 'update all'
+UPDATE_JOBS = 8
+
+#file 'update' appends its per-cast metrics to (as JSON lines), None
+#for no file unless given with --metrics
+METRICS_PATH = None
+
+#number of parallel downloads of 'get --all', overall and per host
+DOWNLOAD_JOBS = 4
+DOWNLOAD_JOBS_PER_HOST = 2
+
+#results shown by 'search'
+SEARCH_LIMIT = 20
 
 # DB_PATH = "C:/Daten/Projekte/Python-Projekte/podcatcher/src/database.sq3"
 MEDIA_PATH = "C:/Daten/Foobar/Podcasts/"
@@ -67,15 +93,28 @@ STATUS_DOWNLOADED_POST = 0
 STATUS_NEW_POST = 1
 STATUS_OLDER_POST = 2
 STATUS_NO_AUDIO_POST = 3
-
-lock = allocate_lock()
-update_result = {}
-thread_started = False
-num_of_threads = 0
+#columns of asDbRow
+SHOW_COLUMNS = "id, feed_id, title, subtitle, author, media_link, \
+    published, status, hash, display_title"
+STATUS_NAMES = {
+    STATUS_DOWNLOADED_POST: "downloaded",
+    STATUS_NEW_POST: "new",
+    STATUS_OLDER_POST: "older",
+    STATUS_NO_AUDIO_POST: "no audio",
+}
 
 class Post(object):
-    """Handle data corresponding to one certain show
+    """Handle data corresponding to one certain show.
+    Big libraries load lots of posts, so there is no per-instance
+    __dict__ and daysOld, hash and printableTitle are computed on
+    first use. The rss-entry is dropped after extraction.
     """
+    __slots__ = (
+        'feedId', 'has_audio', 'id', 'title', 'subtitle', 'author',
+        'published', 'media_link', 'status', 'entry', 'hashDate',
+        '_hash', '_daysOld', '_printableTitle'
+    )
+
     def __init__(self, feedId):
         """initialize
         """
@@ -85,24 +124,66 @@ class Post(object):
         self.title = "no-title"
         self.subtitle = "no-subtitle"
         self.author = "no-author"
-        self.published = ""
+        self.published = None
         self.media_link = ""
-        self.hash = None
         self.status = None
+        self.entry = None
+        self.hashDate = None
+        self._hash = None
+        self._daysOld = None
+        self._printableTitle = None
+
+    @property
+    def hash(self):
+        if self._hash is None and self.hashDate is not None:
+            self._hash = self._getHash()
+        return self._hash
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = value
+
+    @property
+    def daysOld(self):
+        if self._daysOld is None:
+            self._daysOld = self._getDaysSincePublished()
+        return self._daysOld
+
+    @property
+    def printableTitle(self):
+        if self._printableTitle is None:
+            self._printableTitle = makePrintable(self.title)
+        return self._printableTitle
+
+    @property
+    def fileName(self):
+        """name of the media-file inside the folder of the cast
+        """
+        return os.path.basename(self.media_link).split('?')[0]
         
     def fromRssEntry(self, entry):
         """get data from rss-entry
         """
+        self.identify(entry)
+        self.completeFromRssEntry()
+
+    def identify(self, entry):
+        """get only the data the hash is made of from rss-entry.
+        This is enough to decide if the post is known already.
+        """
         self.has_audio = False
         self.entry = entry
         self.title = self._getTitle()
-        self.subtitle = self._getSubtitle()
         self.author = self._getAuthor()
-        self.published = self._getPublished()
+        self.published, self.hashDate = self._getPublished()
+
+    def completeFromRssEntry(self):
+        """get the remaining data of an identified rss-entry
+        """
+        self.subtitle = self._getSubtitle()
         self.media_link = self._extractMediaLinks() 
-        self.hash = self._getHash()
         self.status = STATUS_NEW_POST
-        self.daysOld = self._getDaysSincePublished()
+        self.entry = None
 
     def fromDbRow(self, row):
         """get data from database-row
@@ -110,100 +191,49 @@ class Post(object):
         self.has_audio = True
         self.feedId, self.id, self.title, self.subtitle,\
             self.author, self.published, self.media_link,\
-            self.hash, self.status = row
+            self.hash, self.status, self._printableTitle = row
         # self.feedId = int(self.feedId)
-        self.daysOld = self._getDaysSincePublished()
 
-    def download(self):
-        """download media to hard drive
+    def download(self, progress=progressReport, tagger=None, quiet=False):
+        """download media to hard drive. progress gets called
+        like download.progressReport while downloading. The file
+        is tagged by tagger (a tagging.TaggingPool) if given, else
+        right here. quiet logs the messages of this download at
+        DEBUG, so they don't break the line of a DownloadManager.
         """
+        level = logging.DEBUG if quiet else logging.INFO
         cast = Cast(self.feedId)
         dirname = cast.short_title
-        print('Downloading: %s[%s] "%s"' % (
-            makePrintable(self.title), self.feedId, 
-            makePrintable(dirname))
+        logger.log(level, 'Downloading: %s[%s] "%s"',
+            self.printableTitle, self.feedId, makePrintable(dirname)
         )
-        filename = os.path.basename(self.media_link)
-        filename = filename.split('?')[0]
-
-        targetPath = os.path.join(MEDIA_PATH, dirname)
-
-        if dirname not in os.listdir(MEDIA_PATH):
-            os.mkdir(targetPath)
-
-        if not filename in os.listdir(targetPath):
-            data = downloadAudio(self.media_link)
-            path = os.path.join(targetPath,filename)
-            with open (path,"wb") as fh:
-                fh.write(data)
-            self._tagFile(path, makePrintable(self.title))
+        filename = self.fileName
+
+        index = mediaindex.getIndex(MEDIA_PATH)
+        if not index.hasDir(dirname):
+            index.makeDir(dirname)
+
+        relPath = dirname + u'/' + filename
+        if not index.hasFile(relPath):
+            path = os.path.join(MEDIA_PATH, dirname, filename)
+            size = downloadAudio(self.media_link, path, progress=progress)
+            index.addFile(relPath, size)
+            # tags change the content, it is hashed (and a cross-posted
+            # episode linked to its twin) once they are written
+            after = partial(_indexTagged, index, relPath, size, level)
+            if tagger is not None:
+                tagger.add(path, self.printableTitle, after=after)
+            else:
+                try:
+                    tagging.tagFile(path, self.printableTitle)
+                except Exception as e:
+                    logger.warning("Couldn't tag audio-file: %s (%s)",
+                                   path, e)
+                after()
         else:
-            print "File allready downloaded!"
+            logger.log(level, "File allready downloaded!")
         self._setStatusDownloaded()
 
-    def _tagFile(self, path, title):
-        """use mutagen to set (ID-3)-Tags inside audio file
-        PODCAST_STATUS = new
-        useful for foobar2000's dynamic-playlist function
-        FIXME: this sucks! Make it better!
-        """
-        try:
-            audio = ID3(path)
-        except:
-            try:
-                audio = MP4(path)
-            except:
-                try:
-                    audio = MP3(path, ID3=EasyID3)
-                except:
-                    try:
-                        audio = mutagen_File(path)
-                    except:
-                        print "Couldn't tag audio-file."
-                    else: #mutagen_file
-                        print 'Tagging: FILE passed'
-                        print 'adding tags...'
-                        try:
-                            audio.add_tags()
-                        except:
-                            print 'failed.'
-                        try:
-                            print 'setting title...'
-                            audio["title"] = os.path.basename(path)
-                        except:
-                            print "Couldn't tag audio-file."
-                        else:
-                            print 'setting podcast_status...'
-                            try:
-                                audio['podcast_status'] = 'new'
-                                audio.save()
-                            except:
-                                print "Couldn't tag audio-file."
-                else: #MP3
-                    print 'Tagging MP3 passed'
-                    print 'now trying to add title...'
-                    try:
-                        audio.add_tags()
-                        audio['title'] = title
-                        print "Title added (%s)" % title
-                    except mutagen.id3.error:
-                        print "Couldn't tag audio-file."
-                    else:
-                        print 'Tagging: saving and recalling...'
-                        audio.save()
-                        #now it should be taggable by ID3-class
-                        self._tagFile(path, title)
-                        #TODO: Test if recursion could crash 13.06.2014
-                        #not yet crashed 19.11.2014
-            else:#MP4
-                print 'Tagging: MP4 passed'
-                audio['----:com.apple.iTunes:PODCAST_STATUS'] = "new"
-                audio.save()
-        else:#ID3
-            print 'Tagging: ID3 passed'
-            audio.add(TXXX(encoding=3,desc="PODCAST_STATUS",text="new"))
-            audio.save()
-            
     def is_saved(self):
         """check if post is allready stored to database
         """
@@ -221,30 +251,40 @@ class Post(object):
         """save post to database
         """
         if not self.is_saved():
-            if not self.media_link:
-                status = STATUS_NO_AUDIO_POST;
-            elif self.daysOld > DAYS_OLDER_POST:
-                status = STATUS_OLDER_POST
-            else:
-                status = STATUS_NEW_POST
+            self.status = self.classify()
             with DB() as dbHandler:
                 dbHandler.sql (
-                    "INSERT INTO shows VALUES (?,?,?,?,?,?,?,?,?)",
-                    (
-                        None, self.feedId, self.title, self.subtitle, 
-                        self.author, self.media_link, self.published, 
-                        status, self.hash
-                    )
+                    "INSERT INTO shows (%s) VALUES (?,?,?,?,?,?,?,?,?,?)"
+                    % SHOW_COLUMNS,
+                    self.asDbRow()
                 )
                 self.id = dbHandler.getLastId()
 
+    def classify(self):
+        """return the status a new post gets inside the database
+        """
+        if not self.has_audio:
+            return STATUS_NO_AUDIO_POST
+        elif self.daysOld > DAYS_OLDER_POST:
+            return STATUS_OLDER_POST
+        return STATUS_NEW_POST
+
+    def asDbRow(self):
+        """return the post as row of table shows
+        """
+        return (
+            self.id, self.feedId, self.title, self.subtitle,
+            self.author, self.media_link, self.published,
+            self.status, self.hash, self.printableTitle
+        )
+
     def _getDaysSincePublished(self):
-        """calculate days between today and date of publishing 
+        """calculate days between today and date of publishing,
+        posts without date count as published today
         """
-        today = datetime.now()
-        published = string2DateTime(self.published)
-        diff = today-published
-        return diff.days
+        if self.published is None:
+            return 0
+        return int(time.time() - self.published) // 86400
 
     def update(self):
         if self.daysOld > DAYS_OLDER_POST:
@@ -285,41 +325,38 @@ class Post(object):
     def _extractMediaLinks(self):
         """try to find media-infos of this feed-post
         """
-        self.mediaLinks = []
+        mediaLinks = []
         newTypes = set()
         for link in self.entry.links:
             linktype = 'no_audio'
             linktype = link.get('type', 'no_type')
             if linktype in AUDIO_MIME_TYPES:
-                self.mediaLinks.append((link.href,linktype))
+                mediaLinks.append((link.href,linktype))
                 self.has_audio = True
             elif linktype not in KNOWN_MIME_TYPES:
                 newTypes.add(linktype)
         if newTypes:
-            print("New MimeType(s) found:\n%s" % newTypes)
-        if not self.mediaLinks:
+            logger.debug("New MimeType(s) found:\n%s", newTypes)
+        if not mediaLinks:
             self.has_audio = False
             return "no audio"
         else:
-            return self.mediaLinks[0][0]
+            return mediaLinks[0][0]
 
     def _getPublished(self):
-        """Get published-data from feed-entry.
+        """Get published-data from feed-entry. Returns the epoch
+        and the date as it goes into the hash: 'YYYY-MM-DD HH:MM:SS'
+        on the clock of the feed, like it was stored before the
+        epochs, so the hashes of known posts stay the same.
         """
         try:
             published = self.entry.published
         except:
-            published = u'no date'
-        else:
-            published = published.split()
-            oldString = "%s %s %s %s %s" % (
-                published[0], published[1], published[2][:3],
-                published[3],published[4]
-            )
-            date = datetime.strptime( oldString, "%a, %d %b %Y %H:%M:%S" )
-            newString = date.strftime("%Y-%m-%d %H:%M:%S")
-            published = unicode(newString)
-        return published
+            return None, u'no date'
+        naive, epoch = parseDate(published)
+        if naive is None:
+            return None, u'no date'
+        return epoch, unicode(naive.strftime(LEGACY_FORMAT))
 
     def _getAuthor(self):
         """Get author-data from feed-entry.
@@ -337,7 +374,7 @@ class Post(object):
         m = sha256()
         m.update(unicode.encode(self.title,'utf-8'))
         m.update(unicode.encode(self.author,'utf-8'))
-        m.update(unicode.encode(self.published,'utf-8'))
+        m.update(unicode.encode(self.hashDate,'utf-8'))
         return m.hexdigest()
 
 
@@ -353,84 +390,146 @@ class Podcast(object):
         logo = rss.feed.get('logo', 'noLogo')
         image = rss.feed.get('image', 'noImage')
 
-        print (title, time.strftime("%Y-%m-%d %H:%M:%S", updated), logo, image)
-        print (rss.entries[0].get('title', 'no_title'))
-        print (rss.entries[1].get('title', 'no_title').encode('utf-8'))
+        logger.info("%s", (
+            title, time.strftime("%Y-%m-%d %H:%M:%S", updated), logo, image))
+        logger.info(rss.entries[0].get('title', 'no_title'))
+        logger.info(rss.entries[1].get('title', 'no_title'))
 
 
 
 
 class Cast(object):
-    """Handle all data corresponding to a cast
+    """Handle all data corresponding to a cast.
+    Cast(feedId) returns the same object for the same id during the
+    whole run (identity map). Its data is read from the database on
+    first use: titles, url and http-validators with one query, the
+    hashes of all its posts only when an update needs them.
     """
+    _identityMap = {}
+    _identityLock = allocate_lock()
+
+    def __new__(cls, feedId=None):
+        if feedId is None:
+            return object.__new__(cls)
+        try:
+            key = int(feedId)
+        except ValueError:
+            key = feedId
+        with cls._identityLock:
+            cast = cls._identityMap.get(key)
+            if cast is None:
+                cast = object.__new__(cls)
+                cast._initialized = False
+                cls._identityMap[key] = cast
+        return cast
+
     def __init__(self, feedId=None):
-        self.feedId = feedId
-        self.rss = None
-        self.allPosts = {}
-        if self.feedId != None:
-            self.title = self._getTitle()
-            self.short_title = self._get_short_title()
+        if getattr(self, '_initialized', False):
+            return
+        try:
+            self.feedId = int(feedId) if feedId is not None else None
+        except ValueError:
+            self.feedId = feedId
+        self._data = None
+        self._knownHashes = None
+        self._initialized = True
+
+    @classmethod
+    def forget(cls, feedId=None):
+        """drop one cast (or all of them) from the identity map
+        """
+        with cls._identityLock:
+            if feedId is None:
+                cls._identityMap.clear()
+            else:
+                cls._identityMap.pop(int(feedId), None)
+
+    @property
+    def title(self):
+        return self._getData()['title']
+
+    @property
+    def short_title(self):
+        return self._getData()['short_title']
+
+    @property
+    def knownHashes(self):
+        if self._knownHashes is None:
             self._getAllPosts()
+        return self._knownHashes
 
     def change_url(self, new_url):
         """change url of this cast inside DB
         """
         db.change_feed_url(self.feedId, new_url)
+        self._data = None
 
     def get_image(self):
         """check for image and download it to folder as
         'cover.jpg'"""
-        self.rss = self._fetchFeed()
-        image = self.rss.feed.get('image', None)
+        rss = self._fetchFeed(conditional=False)
+        image = rss.feed.get('image', None)
         if image:
             image_path = image.get('href', None)
             if image_path:
-                data = downloadAudio(image_path)
                 # newly added casts have no folder yet
-                if self.short_title not in os.listdir(MEDIA_PATH):
-                    os.mkdir(os.path.join(MEDIA_PATH, self.short_title))
+                index = mediaindex.getIndex(MEDIA_PATH)
+                if not index.hasDir(self.short_title):
+                    index.makeDir(self.short_title)
                 target_path = os.path.join(
                     MEDIA_PATH, 
                     self.short_title,
                     'cover.jpg')
-                with open (target_path,"wb") as fh:
-                    fh.write(data)
-                print ('Image saved under: \n%s' % target_path)
+                downloadAudio(image_path, target_path)
+                logger.info('Image saved under: \n%s', target_path)
         else:
-            print ('No Image found')
+            logger.info('No Image found')
 
     def getLatestPost(self):
         """alias-function to get the single latest post
         """
         return self.getLatestPosts()
 
-    def listAll(self):
-        print "------------ %s(%s) ------------\n" % (
-            makePrintable(self.title), self.feedId
-        )
-        with DB() as dbHandler:
-            result = dbHandler.sql("SELECT id, title, published, status \
-                FROM shows WHERE feed_id=? ORDER BY published DESC",
-                (self.feedId,)
-            )
-        for row in result:
-            status = row[3]
-            if status == STATUS_DOWNLOADED_POST:
-                status = "downloaded"
-            elif status == STATUS_NEW_POST:
-                status = "new"
-            elif status == STATUS_NO_AUDIO_POST:
-                status = "no audio"
-            else:
-                status = "older"
-            print "(%05d) [%s] %s /'%s'" % (
-                row[0], row[2], makePrintable(row[1]), status
+    def listAll(self, limit=-1, after=None, tabular=False):
+        """print the posts newest first, at most 'limit' of them
+        after the post with id 'after'
+        """
+        if not tabular:
+            output.info("------------ %s(%s) ------------\n",
+                self.title, self.feedId
             )
+        sql = "SELECT id, title, published, status, display_title \
+            FROM shows WHERE feed_id=?"
+        parameters = [self.feedId]
+        if after is not None:
+            published = _getShowKey(after)[1]
+            # newest first, no date last
+            sql += " AND (published<? OR (published IS NULL AND ? IS NOT NULL) \
+                OR (published IS ? AND id<?))"
+            parameters += [published, published, published, after]
+        sql += " ORDER BY published DESC, id DESC LIMIT ?"
+        parameters.append(limit + 1 if limit >= 0 else -1)
+        lastId = after
+        with DB() as dbHandler:
+            rows = dbHandler.iterate(sql, parameters)
+            for number, row in enumerate(rows):
+                if number == limit:
+                    if not tabular:
+                        _morePosts(lastId)
+                    break
+                lastId = row[0]
+                status = STATUS_NAMES.get(row[3], "older")
+                if tabular:
+                    _printTabular(row[0], self.feedId, row[2], status, row[1])
+                else:
+                    output.info("(%05d) [%s] %s /'%s'",
+                        row[0], formatEpoch(row[2]), row[4], status
+                    )
 
     def getPost(self, post_id):
         with DB() as dbHandler:
             result = dbHandler.sql("SELECT feed_id, id, title, subtitle,\
-                author, published, media_link, hash, status\
+                author, published, media_link, hash, status, display_title\
                 FROM shows WHERE id=?",(post_id,)
             )
         post = Post(self.feedId)
@@ -443,7 +542,7 @@ class Cast(object):
         post = Post(self.feedId)
         with DB() as dbHandler:
             result = dbHandler.sql("SELECT feed_id, id, title, subtitle, \
-                author, published, media_link, hash, status \
+                author, published, media_link, hash, status, display_title \
                 FROM shows WHERE feed_id=? AND status<>? AND status <>? \
                 ORDER BY published DESC LIMIT ?",
                 (self.feedId, STATUS_DOWNLOADED_POST, 
@@ -462,55 +561,107 @@ class Cast(object):
             else:
                 return postList
         else:
-            print "No new posts."
+            logger.info("No new posts.")
             return None
 
-    def update(self):
-        """Main-function to look for new posts.
+    def update(self, rss=None, incremental=True, stream=False,
+               metrics=None):
+        """Main-function to look for new posts. Returns a dict
+        with the title, the list of new posts (or None), whether
+        the feed was unchanged since the last update and the
+        CastMetrics of the update (filled into metrics if given).
+        The feed is fetched here unless an already fetched
+        and parsed rss is passed in.
+        If incremental is set, a feed ordered newest-first is read
+        only up to INCREMENTAL_KNOWN_RUN known entries in a row.
+        With stream the feed is read entry by entry by streamfeed.
         """
-        global lock, update_result, thread_started, num_of_threads
-
-        lock.acquire()
-        update_result[self.feedId] = {}
-        update_result[self.feedId]['title'] = self.title
-        update_result[self.feedId]['posts'] = []
-        thread_started = True
-        num_of_threads += 1
-        lock.release()
-
-        self.rss = self._fetchFeed()
-        numOfUpdates = 0
-
-        for entry in self.rss.entries:
-            post = Post(self.feedId)
-            post.fromRssEntry(entry)
-            # try:
-            # except:
-            #     print ("{}creating Post failed [{}]".format("\n", self.feedId))
-            #     print (sys.exc_info())
-            if not self._isInsideDB(post):
-                numOfUpdates += 1
-                lock.acquire()
-                post.save()
-                update_result[self.feedId]['posts'].append(
-                    makePrintable("(%s):%s"%(post.id, post.title))
-                )
-                lock.release()
-        if not numOfUpdates:
-            lock.acquire()
-            update_result[self.feedId]['posts'] = None
-            lock.release()
-
-        self._markOlderPosts()
-        self._updated()
-        lock.acquire()
-        num_of_threads -= 1
-        print ("(%s) updated." % self.title)
-        # sys.stdout.write(".")
-        lock.release()
+        if metrics is None:
+            metrics = CastMetrics(self.feedId)
+        metrics.title = self.title
+        result = {'title': self.title, 'posts': None, 'unchanged': False,
+                  'metrics': metrics}
+        if rss is None:
+            rss = self._fetchFeed(stream=stream, metrics=metrics)
+        if rss.get('status') == 304:
+            result['unchanged'] = metrics.unchanged = True
+            with metrics.phase('mark'):
+                self._updated()
+            metrics.finish()
+            logger.info("(%s) unchanged.", self.title)
+            return result
+
+        newPosts = []
+        newHashes = set()
+        knownInARow = 0
+        newestFirst = incremental
+        lastPublished = None
+        with metrics.phase('posts'):
+            for entry in rss.entries:
+                metrics.count('entries')
+                post = Post(self.feedId)
+                post.identify(entry)
+                # try:
+                # except:
+                #     print ("{}creating Post failed [{}]".format("\n", self.feedId))
+                #     print (sys.exc_info())
+                if newestFirst:
+                    # a single entry out of order and the feed is read fully
+                    if post.published is None or (lastPublished is not None
+                            and post.published > lastPublished):
+                        newestFirst = False
+                    lastPublished = post.published
+                if post.hash in newHashes or self._isInsideDB(post):
+                    knownInARow += 1
+                    if newestFirst and knownInARow >= INCREMENTAL_KNOWN_RUN:
+                        break
+                    continue
+                knownInARow = 0
+                post.completeFromRssEntry()
+                newHashes.add(post.hash)
+                post.status = post.classify()
+                newPosts.append(post)
+
+        with transaction():
+            if newPosts:
+                with metrics.phase('save'):
+                    self._savePosts(newPosts)
+            with metrics.phase('mark'):
+                self._markOlderPosts()
+                self._updated(rss.get('etag'), rss.get('modified'))
+        metrics.count('new_posts', len(newPosts))
+        metrics.finish()
+        if newPosts:
+            result['posts'] = [
+                "(%s):%s"%(post.id, post.printableTitle)
+                for post in newPosts
+            ]
+
+        logger.info("(%s) updated.", self.title)
+        return result
         
+    def _savePosts(self, posts):
+        """insert new posts with one statement and set their ids.
+        Must run inside a transaction, so no other writer can
+        take ids in between.
+        """
+        with DB() as dbHandler:
+            lastId = dbHandler.sql("SELECT MAX(id) FROM shows")[0][0] or 0
+            dbHandler.sqlmany(
+                "INSERT OR IGNORE INTO shows (%s) \
+                VALUES (?,?,?,?,?,?,?,?,?,?)" % SHOW_COLUMNS,
+                [post.asDbRow() for post in posts]
+            )
+            ids = dict(dbHandler.sql(
+                "SELECT hash, id FROM shows WHERE feed_id=? AND id>?",
+                (self.feedId, lastId)
+            ))
+        for post in posts:
+            post.id = ids.get(post.hash)
+            self.knownHashes.add(post.hash)
+
     def _markOlderPosts(self):
-        then = now(DAYS_OLDER_POST)[1]
+        then = int(time.time()) - DAYS_OLDER_POST * 86400
         with DB() as dbHandler:
             dbHandler.sql(
                 "UPDATE shows set status=? WHERE published <? \
@@ -520,89 +671,113 @@ class Cast(object):
                 )
             )
 
-    def _updated(self):
-        """update last_updated inside DB to now
+    def _updated(self, etag=None, modified=None):
+        """update last_updated inside DB to now, remember the
+        http-validators of the feed (if the server sent some) and
+        schedule the next update
         """
         with DB() as dbHandler:
             dbHandler.sql(
-                "UPDATE casts SET last_updated=? WHERE id=?",
-                (now()[1], self.feedId)
+                "UPDATE casts SET last_updated=?, \
+                etag=COALESCE(?, etag), \
+                last_modified=COALESCE(?, last_modified) WHERE id=?",
+                (now()[1], etag, modified, self.feedId)
             )
+            if self._data is not None:
+                self._data['etag'] = etag or self._data['etag']
+                self._data['last_modified'] = (
+                    modified or self._data['last_modified'])
+            published = [row[0] for row in dbHandler.sql(
+                "SELECT published FROM shows WHERE feed_id=? \
+                AND published IS NOT NULL ORDER BY published DESC LIMIT ?",
+                (self.feedId, scheduler.HISTORY)
+            )]
+        epoch = int(time.time())
+        interval = scheduler.getInterval(published, epoch, UPDATE_TIME * 60)
+        db.set_next_update(
+            self.feedId, scheduler.getNextUpdate(interval, epoch), interval
+        )
 
     def _isInsideDB(self, post):
         # TODO: implement update-activity on site 
         # (same date, changed title; same title changed date)
-        if post.hash in self.allPosts.values():
-            return True
-        return False
+        return post.hash in self.knownHashes
 
     def _getAllPosts(self):
         with DB() as dbHandler:
             result = dbHandler.sql(
-                "SELECT id, hash FROM shows WHERE feed_id=?",
+                "SELECT hash FROM shows WHERE feed_id=?",
                 (self.feedId,)
             )
-        for row in result:
-            self.allPosts[row[0]] = row[1]
-
-    def _fetchFeed(self):
-        """Use feedparser module to get the feed-data
-        from one podcast.
+        self._knownHashes = set(row[0] for row in result)
+
+    def _fetchFeed(self, conditional=True, stream=False, metrics=None):
+        """Get the feed-data of one podcast through the shared
+        connection-pool and parse it with feedparser. If
+        conditional is set, the stored
+        ETag/Last-Modified are sent along and an unchanged
+        feed comes back with status 304 and without entries.
+        With stream the entries are parsed one at a time while
+        reading by streamfeed, which has no feed-level data.
+        Timings and size go to metrics (a CastMetrics) if given.
         """
-        with DB() as dbHandler:
-            result = dbHandler.sql(
-                "SELECT url FROM casts WHERE id=?",
-                (self.feedId,)
+        if metrics is None:
+            metrics = CastMetrics(self.feedId)
+        url, etag, modified = self._getFeedSource()
+        if not conditional:
+            etag = modified = None
+        if stream:
+            with metrics.phase('fetch'):
+                return streamfeed.parse(url, etag, modified)
+        with metrics.phase('fetch'):
+            response = httppool.fetch(
+                url, httppool.getConditionalHeaders(etag, modified)
             )
-        url = result[0][0]
-        return feedparser.parse(url)
+        _checkResponse(response)
+        metrics.count('bytes', len(response.body))
+        with metrics.phase('parse'):
+            return _rssFromResponse(response)
 
-    def _getTitle(self):
-        """read title from database and make it printable
+    def _getFeedSource(self):
+        """return (url, etag, last_modified) of the feed
         """
-        with DB() as dbHandler:
-            title = dbHandler.sql(
-                "SELECT title FROM casts WHERE id=?",
-                (self.feedId,)
-            )
-        if title:
-            return makePrintable(title[0][0])
-        else:
-            raise IndexError("Feed-id does not exist.")
-    
-    def _get_short_title(self):
-        """read short_title from database
+        data = self._getData()
+        return data['url'], data['etag'], data['last_modified']
+
+    def _getData(self):
+        """read all columns of the cast from database, once
         """
-        with DB() as dbHandler:
-            title = dbHandler.sql(
-                "SELECT short_title FROM casts WHERE id=?",
-                (self.feedId,)
-            )
-        if title:
-            return title[0][0]
-        else:
-            raise IndexError("Feed-id does not exist.")      
+        if self._data is None:
+            with DB() as dbHandler:
+                result = dbHandler.sql(
+                    "SELECT display_title, short_title, url, etag, \
+                    last_modified FROM casts WHERE id=?",
+                    (self.feedId,)
+                )
+            if not result:
+                Cast.forget(self.feedId)
+                raise IndexError("Feed-id does not exist.")
+            title, short_title, url, etag, modified = result[0]
+            self._data = {
+                'title': title,
+                'short_title': short_title,
+                'url': url,
+                'etag': etag,
+                'last_modified': modified,
+            }
+        return self._data
 
 #------------------------------------------- -------------------------------------------------------------
 #-------------------------------------------------- functions --------------------------------------------
 #------------------------------------------- -------------------------------------------------------------
 
-def makePrintable(unprintable):
-    """change unprintable characters into '-'
-    """
-    return "".join(
-        #match returns either none or not none -> (0,1)
-        #known characters are therefor selecting the x in the two-item-list
-        #unkown characters select the '{?}'
-        #finally everything is joined together
-        #an example of bad, cause unreadable code! :]
-        [['{?}',x][re.match(u"[\[\]\w -.:@~/äöüÄÖÜß]",x)!=None] for x in unprintable ]
-    )
-
-def string2DateTime(dtString):
-    """return our string-format as datetime-object
+def _indexTagged(index, relPath, size, level=logging.INFO):
+    """add a downloaded and tagged file to the index with its
+    checksum, as hard-link if the same content is there already
     """
-    return datetime.strptime(dtString, "%Y-%m-%d %H:%M:%S")
+    sameContent = index.addUnique(relPath, size)
+    if sameContent:
+        logger.log(level, "Same as %s, linked.", sameContent)
 
 def now(daysInThePast=0):
     now = datetime.now()
@@ -616,12 +791,12 @@ def removeCast(feedId):
     """remove cast and it's posts from database
     """
     cast = Cast(feedId);
-    print "This will remove '%s' and %d posts from database." % (
-        makePrintable(cast.title), len(cast.allPosts)
+    logger.info("This will remove '%s' and %d posts from database.",
+        cast.title, len(cast.knownHashes)
     )
     answer = raw_input("Continue? (y/n)")
     if answer == 'y':
-        with DB() as dbHandler:
+        with transaction(), DB() as dbHandler:
             dbHandler.sql(
                 "DELETE FROM shows WHERE feed_id=?",
                 (feedId,)
@@ -630,9 +805,10 @@ def removeCast(feedId):
                 "DELETE FROM casts WHERE id=?",
                 (feedId,)
             )
-        print "deleted."
+        Cast.forget(feedId)
+        logger.info("deleted.")
     else:
-        print "ok, deletion canceled."
+        logger.info("ok, deletion canceled.")
 
 def get_active_podcasts():
     """Get (id, title, url) tuple-list from all active
@@ -640,7 +816,7 @@ def get_active_podcasts():
     """
     with DB() as dbHandler:
         results = dbHandler.sql(
-            "SELECT id, title, url FROM casts WHERE status=?",
+            "SELECT id, title, url FROM casts WHERE status=? ORDER BY id",
             (STATUS_UPDATE_CAST,)
         )
     return results
@@ -648,44 +824,14 @@ def get_active_podcasts():
 def list_podcasts():
     """Print all podcasts to screen
     """
-    casts = get_active_podcasts()
-    for cast in casts:
-        print "(%03d) %s" % (cast[0], makePrintable(cast[1]))
-
-def progressReport(bytesSoFar, chunkSize, totalSize):
-    """Write download-progress to stdout.
-    """
-    percent = float(bytesSoFar) / totalSize
-    percent = round(percent*100, 2)
-    sys.stdout.write(
-        "Downloaded %d of %d bytes (%0.2f%%)\r" % 
-        (bytesSoFar, totalSize, percent)
-    )
-    if bytesSoFar >= totalSize:
-        sys.stdout.write('\nready.\n')
-
-def downloadAudio(url, chunkSize=32768):
-    """Download audio-data via http.
-    """
-    requ = urllib2.Request(url, headers={'User-Agent':'Fussels Podcatcher'})
-    response = urllib2.urlopen(requ, None, 5)
-    totalSize = response.info().getheader('Content-Length').strip()
-    totalSize = int(totalSize)
-    bytesSoFar = 0
-    data = None
-
-    while 1:
-        chunk = response.read(chunkSize)
-        if not data:
-            data = chunk
-            bytesSoFar += len(chunk)
-        else:
-            data += chunk
-            bytesSoFar += len(chunk)
-        if not chunk:
-            break
-        progressReport(bytesSoFar, chunkSize, totalSize)
-    return data
+    with DB() as dbHandler:
+        casts = dbHandler.iterate(
+            "SELECT id, display_title FROM casts WHERE status=? \
+            ORDER BY id",
+            (STATUS_UPDATE_CAST,)
+        )
+        for cast in casts:
+            output.info("(%03d) %s", cast[0], cast[1])
 
 def downloadLatest(feedId, number=1):
     """download the latest post, or number of 
@@ -699,6 +845,64 @@ def downloadLatest(feedId, number=1):
         for post in posts:
             post.download()
 
+def downloadAllNew(jobs=DOWNLOAD_JOBS, perHost=DOWNLOAD_JOBS_PER_HOST,
+                   tagJobs=tagging.TAGGING_JOBS):
+    """download all posts with STATUS_NEW_POST, newest first, with
+    'jobs' parallel downloads and at most 'perHost' per host. The
+    files are tagged meanwhile by 'tagJobs' threads.
+    """
+    with DB() as dbHandler:
+        result = dbHandler.sql("SELECT feed_id, id, title, subtitle, \
+            author, published, media_link, hash, status, display_title \
+            FROM shows WHERE status=? ORDER BY published DESC",
+            (STATUS_NEW_POST,)
+        )
+    if not result:
+        logger.info("No new posts.")
+        return
+    # posts sharing a file (same cast, same name) must not download
+    # it in parallel, the first one gets it for all of them
+    groups = {}
+    order = []
+    for row in result:
+        post = Post(row[0])
+        post.fromDbRow(row)
+        target = (post.feedId, post.fileName)
+        if target not in groups:
+            groups[target] = []
+            order.append(target)
+        groups[target].append(post)
+    manager = DownloadManager(jobs, perHost)
+    tagger = tagging.TaggingPool(tagJobs)
+    sizes = {}
+    for target in order:
+        posts = groups[target]
+        post = posts[0]
+        host = urlparse.urlsplit(post.media_link).hostname
+        label = "(%s):%s" % (post.id, post.printableTitle)
+        sizes[label] = len(posts)
+        manager.add(
+            host, label, partial(_downloadShared, posts, tagger=tagger)
+        )
+    try:
+        done, failed = manager.run()
+    finally:
+        tagger.close()
+    logger.info("%d of %d posts downloaded.",
+                sum(sizes[label] for label in done), len(result))
+    for label, error in failed:
+        logger.warning("failed: %s (%s)", label, error)
+    tagger.report()
+
+def _downloadShared(posts, progress, tagger=None):
+    """download the file of posts[0] and mark the others, which
+    point to the same file, as downloaded too
+    """
+    posts[0].download(progress, tagger=tagger, quiet=True)
+    for post in posts[1:]:
+        logger.debug("(%s) shares its file with (%s).", post.id, posts[0].id)
+        post._setStatusDownloaded()
+
 def getCast(cast_id):
     try:
         feed_id = int(cast_id)
@@ -707,16 +911,21 @@ def getCast(cast_id):
     if feed_id:
         try:
             cast = Cast(feed_id)
+            cast.title
         except IndexError:
-            print "No subscription with this cast-id."
+            logger.info("No subscription with this cast-id.")
             return None
         else:
             return cast
     else:
-        print "Cast with that name not found."
+        logger.info("Cast with that name not found.")
         return None
 
 def searchCast(cast_name):
+    result = db.search_casts(cast_name, 1)
+    if result:
+        return int(result[0][0])
+    # the words may be inside others, 'cast' in 'Podcast'
     with DB() as dbHandler:
         result = dbHandler.sql(
             "SELECT id FROM casts WHERE title LIKE ?",
@@ -727,59 +936,207 @@ def searchCast(cast_name):
                 return int(result[0][0])
         return None
 
-def getNewPosts():
-    """return all new that are not older than DAYS_OLDER_POST
+def getNewPosts(limit=-1, after=None, tabular=False):
+    """print the new posts by cast, at most 'limit' of them after the
+    post with id 'after'
+    """
+    sql = "SELECT P.title, P.published, F.display_title, F.id, P.id, \
+        P.display_title FROM shows AS P JOIN casts AS F ON F.id=P.feed_id WHERE P.status=?"
+    parameters = [STATUS_NEW_POST]
+    if after is not None:
+        feedId, published = _getShowKey(after)
+        # the order of the index (status, feed_id, published, id)
+        sql += " AND (P.feed_id>? OR (P.feed_id=? AND (P.published>? \
+            OR (? IS NULL AND P.published IS NOT NULL) \
+            OR (P.published IS ? AND P.id>?))))"
+        parameters += [feedId, feedId, published, published, published, after]
+    sql += " ORDER BY P.feed_id, P.published, P.id LIMIT ?"
+    parameters.append(limit + 1 if limit >= 0 else -1)
+    lastCast = None
+    lastId = after
+    with DB() as dbHandler:
+        rows = dbHandler.iterate(sql, parameters)
+        for number, line in enumerate(rows):
+            if number == limit:
+                if not tabular:
+                    _morePosts(lastId)
+                break
+            lastId = line[4]
+            if tabular:
+                _printTabular(line[4], line[3], line[1], "new", line[0])
+                continue
+            if lastCast != line[3]:
+                output.info("---------------------------------------\n%s(%s):",
+                    line[2], line[3]
+                )
+                lastCast = line[3]
+            output.info("[%06d]'%s'\n(%s)", line[4], line[5],
+                formatEpoch(line[1])
+            )
+
+def _getShowKey(showId):
+    """(feed_id, published) of the show with this id, where --after
+    continues. KeyError if there is none.
     """
     with DB() as dbHandler:
         result = dbHandler.sql(
-            "SELECT P.title, P.published, F.title, F.id, P.id \
-            FROM shows AS P JOIN casts AS F ON F.id=P.feed_id \
-            WHERE P.status=? ORDER BY F.id, P.published",
-            (STATUS_NEW_POST,)
+            "SELECT feed_id, published FROM shows WHERE id=?", (showId,))
+    if not result:
+        raise KeyError("Show with id %d doesn't exist." % showId)
+    return result[0]
+
+def _morePosts(lastId):
+    if lastId is None:
+        output.info("... more")
+    else:
+        output.info("... more with --after %d", lastId)
+
+def _printTabular(showId, feedId, published, status, title):
+    """one tab-separated line for scripts: id, cast-id, published
+    (epoch, empty without date), status and title
+    """
+    title = u' '.join((title or u'').split())
+    sys.stdout.write((u'%d\t%d\t%s\t%s\t%s\n' % (
+        showId, feedId, '' if published is None else published, status,
+        title)).encode('utf-8'))
+
+def updateCasts(feedIds, jobs=UPDATE_JOBS, incremental=True, stream=False):
+    """update the casts with these ids using a pool of at most
+    'jobs' worker-threads. Returns a dict feedId -> update-result.
+    """
+    if not feedIds:
+        return {}
+    pool = ThreadPool(max(1, min(jobs, len(feedIds))))
+    try:
+        # a timeout keeps the wait interruptible by ctrl-c
+        results = pool.map_async(
+            partial(_updateCast, incremental=incremental, stream=stream),
+            feedIds
+        ).get(2**31)
+    finally:
+        pool.terminate()
+        pool.join()
+    return dict(results)
+
+def _updateCast(feedId, incremental=True, stream=False):
+    """worker of updateCasts: update one cast and return
+    (feedId, result). A failing feed must not stop the others.
+    """
+    metrics = CastMetrics(feedId)
+    try:
+        cast = Cast(feedId)
+        return feedId, cast.update(
+            incremental=incremental, stream=stream, metrics=metrics
         )
-    lastCast = ""
-    for line in result:
-        if lastCast != line[2]:
-            print "---------------------------------------\n%s(%s):" % (
-                makePrintable(line[2]), line[3]
+    except Exception as e:
+        return feedId, _failedUpdate(feedId, e, metrics)
+
+def _failedUpdate(feedId, error, metrics=None):
+    """report a failed update and return its result-dict
+    """
+    if metrics is not None:
+        metrics.finish(failed=True)
+    logger.warning("(%s) update failed: %s", feedId, error)
+    # try again after the shortest interval, not on every run
+    epoch = int(time.time())
+    db.set_next_update(
+        feedId, scheduler.getNextUpdate(UPDATE_TIME * 60, epoch)
+    )
+    return {'title': str(feedId), 'posts': None, 'unchanged': False,
+            'metrics': metrics}
+
+def updateCastsAsync(feedIds, connections=UPDATE_JOBS, incremental=True,
+                     stream=False):
+    """update the casts with these ids like updateCasts, but fetch
+    the feeds with the event-driven asyncfetch-engine from one
+    thread. Every feed is parsed and saved as soon as it arrived.
+    """
+    engine = asyncfetch.FetchEngine(connections)
+    casts = {}
+    update_result = {}
+    for feedId in feedIds:
+        try:
+            cast = Cast(feedId)
+            url, etag, modified = cast._getFeedSource()
+        except Exception as e:
+            update_result[feedId] = _failedUpdate(feedId, e)
+            continue
+        casts[feedId] = cast
+        engine.add(feedId, url, httppool.getConditionalHeaders(etag, modified))
+
+    for feedId, response in engine.run():
+        # the fetches overlap, only the work after arrival is timed
+        metrics = CastMetrics(feedId)
+        try:
+            _checkResponse(response)
+            metrics.count('bytes', len(response.body))
+            with metrics.phase('parse'):
+                rss = _rssFromResponse(response, stream)
+            update_result[feedId] = casts[feedId].update(
+                rss, incremental, metrics=metrics
             )
-            lastCast = line[2]
-        print "[%06d]'%s'\n(%s)" % (line[4], makePrintable(line[0]), 
-            makePrintable(line[1])
-        )
+        except Exception as e:
+            update_result[feedId] = _failedUpdate(feedId, e, metrics)
+    return update_result
 
-def print_results_to_screen():
-    global update_result
+def _checkResponse(response):
+    """raise IOError if the feed couldn't be fetched: no answer or a
+    status other than 2xx and 304 (not modified)
+    """
+    if response.error:
+        raise IOError(response.error)
+    if response.status != 304 and not 200 <= response.status < 300:
+        raise IOError("HTTP Error %d" % response.status)
+
+def _rssFromResponse(response, stream=False):
+    """turn an asyncfetch.Response (or httppool.Response) into the
+    feedparser-result Cast.update expects
+    """
+    if response.status == 304:
+        rss = feedparser.FeedParserDict(entries=[], feed={})
+    elif stream:
+        rss = streamfeed.parseFile(StringIO(response.body))
+    else:
+        rss = feedparser.parse(
+            response.body, response_headers=response.headers
+        )
+    rss['status'] = response.status
+    rss['href'] = response.url
+    for key, header in (('etag', 'etag'), ('modified', 'last-modified')):
+        if header in response.headers:
+            rss[key] = response.headers[header]
+    return rss
+
+def print_results_to_screen(update_result, slowest=0):
+    """print the new posts of an update, with slowest the table of
+    the slowest casts after it
+    """
+    unchanged = 0
     for index in sorted(update_result):
+        if update_result[index].get('unchanged'):
+            unchanged += 1
         if update_result[index]['posts']:
-            print "-----------------------------------------\n(%d)%s" % (
+            logger.info("-----------------------------------------\n(%d)%s",
                 index, update_result[index]['title']
             )
             for postTitle in update_result[index]['posts']:
-                print "\t%s"%postTitle
-            print "-----------------------------------------\n"
-
-#---------------------------  database helper ----------------------            
-
-def createTableCasts():
-    """database-init: table casts
-    """
-    with DB() as dbHandler:
-        dbHandler.sql(
-            "CREATE TABLE casts (id INTEGER PRIMARY KEY \
-            AUTOINCREMENT, title TEXT, url TEXT,\
-            last_updated TEXT, short_title TEXT, status INT)"
+                logger.info("\t%s", postTitle)
+            logger.info("-----------------------------------------\n")
+    if unchanged:
+        logger.info("%d of %d feeds unchanged since last update (skipped).",
+            unchanged, len(update_result)
         )
+    if slowest:
+        logger.info('')
+        printSlowest(_getMetrics(update_result), slowest)
 
-def createTableShows():
-    """database-init: table shows
-    """
-    with DB() as dbHandler:
-        dbHandler.sql(
-            "CREATE TABLE shows (id INTEGER PRIMARY KEY AUTOINCREMENT, \
-                feed_id TEXT, title TEXT, subtitle TEXT, author TEXT, \
-                media_link TEXT, published TEXT, status INT, hash TEXT)"
-        )
+def _getMetrics(update_result):
+    return [
+        result['metrics'] for feedId, result in sorted(update_result.items())
+        if result.get('metrics') is not None
+    ]
+
+#---------------------------  database helper ----------------------            
 
 def export_cast_urls():
     with DB() as dbHandler:
@@ -798,37 +1155,43 @@ def create_all_dirs():
             "SELECT short_title FROM casts WHERE status=?",
             (STATUS_UPDATE_CAST,)
         )
+    index = mediaindex.getIndex(MEDIA_PATH)
     for result in results:
-        if result[0] not in os.listdir(MEDIA_PATH):
-            os.mkdir(os.path.join(MEDIA_PATH, result[0]))
+        if not index.hasDir(result[0]):
+            index.makeDir(result[0])
 
 #---------------------------  command-line funcs -------------------
 
 def commandUpdateAll(args):
     """update all podcasts with the status_flag set to STATUS_UPDATE_CAST
     """
-    global update_result, thread_started, num_of_threads
-    
-    if (args.feedId == 'all'):
-        print("updating podcasts...")
-        castsToUpdate = get_active_podcasts()
-        allThreads = []
-        for data in castsToUpdate:
-            feedId = data[0]
-            cast = Cast(feedId)
-            start_new_thread(cast.update,())
-
-        while not thread_started:
-            pass
-
-        while num_of_threads > 0:
-            pass
+    if args.feedId in ('all', 'due'):
+        logger.info("updating podcasts...")
+        feedIds = [data[0] for data in get_active_podcasts()]
+        if args.feedId == 'due':
+            active = len(feedIds)
+            feedIds = db.get_ids_for_update(
+                STATUS_UPDATE_CAST, int(time.time())
+            )
+            logger.info("%d of %d casts are due.", len(feedIds), active)
+        if args.engine == 'async':
+            update_result = updateCastsAsync(
+                feedIds, args.jobs, not args.full, args.stream
+            )
+        else:
+            update_result = updateCasts(
+                feedIds, args.jobs, not args.full, args.stream
+            )
     else:
         cast = Cast(args.feedId)
-        cast.update()
+        update_result = {int(cast.feedId): cast.update(
+            incremental=not args.full, stream=args.stream
+        )}
 
-    print("\nready.")
-    print_results_to_screen()
+    logger.info("\nready.")
+    print_results_to_screen(update_result, args.slowest)
+    if args.metrics:
+        writeJsonLines(args.metrics, _getMetrics(update_result))
 
 def updateCast(args):
    """Update only one crertain cast
@@ -847,13 +1210,14 @@ def commandAddPodcast(args):
         with DB() as dbHandler:
             dbHandler.sql(
                 "INSERT INTO casts (\
-                    title, url, last_updated, status, short_title\
-                    ) VALUES (?,?,?,?,?)", (
+                    title, url, last_updated, status, short_title,\
+                    display_title) VALUES (?,?,?,?,?,?)", (
                         cast.feed.title, 
                         args.url, 
                         now()[1], 
                         STATUS_UPDATE_CAST, 
-                        args.short_title
+                        args.short_title,
+                        makePrintable(cast.feed.title)
                     )
             )
             feedId = dbHandler.getLastId()
@@ -869,16 +1233,37 @@ def commandChangeUrl(args):
     # print args.id, args.new_url
 
 def commandStatus(args):
-    if args.new:
-        getNewPosts()
-    elif args.cast_id:
-        cast = getCast(args.cast_id)
-        if cast:
-            cast.listAll()
-        else:
-            "Cast with this id or name not found."
-    elif args.casts:
-        list_podcasts()
+    page = {'limit': args.limit, 'after': args.after, 'tabular': args.tab}
+    try:
+        if args.new:
+            getNewPosts(**page)
+        elif args.cast_id:
+            cast = getCast(args.cast_id)
+            if cast:
+                cast.listAll(**page)
+        elif args.casts:
+            list_podcasts()
+    except KeyError as e:
+        logger.info(e.args[0])
+
+def commandSearch(args):
+    text = ' '.join(args.words)
+    if isinstance(text, str):
+        # arguments come as bytes
+        text = text.decode(sys.stdin.encoding or 'utf-8', 'replace')
+    casts = [] if args.shows_only else db.search_casts(text, args.limit)
+    for cast_id, title in casts:
+        output.info("(%s) %s", cast_id, title)
+    shows = db.search_shows(text, args.limit)
+    if casts and shows:
+        output.info("---------------------------------------")
+    for show_id, feed_id, cast_title, title, published, status in shows:
+        output.info("[%06d]'%s'\n(%s) %s(%s)%s", show_id,
+            title, formatEpoch(published), cast_title or '', feed_id,
+            ' new' if status == STATUS_NEW_POST else ''
+        )
+    if not casts and not shows:
+        output.info("Nothing found.")
 
 def commandGet(args):
     if args.casts:
@@ -887,12 +1272,9 @@ def commandGet(args):
             if cast:
                 post = cast.getLatestPosts(1)
                 post.download()
-            else:
-                "Cast with this id or name not found."
     
     elif args.all:
-        print 'I should download all new casts,'
-        print 'but I need some implementation. :('
+        downloadAllNew(args.jobs, args.per_host)
 
     elif args.shows:
         for show_id in args.shows:
@@ -907,13 +1289,26 @@ def commandRemove(args):
     for cast_id in args.ids:
         removeCast(cast_id)
 
+def commandRescan(args):
+    index = mediaindex.getIndex(MEDIA_PATH)
+    dirs, files = index.rescan()
+    logger.info('%d directories read, %d files changed', dirs, files)
+
+def commandDedupe(args):
+    index = mediaindex.getIndex(MEDIA_PATH)
+    hashed, linked, reclaimed = index.dedupe(args.jobs, args.dry_run)
+    logger.info('%d files hashed, %d duplicates %s, %0.1f MB %s',
+        hashed, linked, 'found' if args.dry_run else 'linked',
+        reclaimed / 1048576.0,
+        'to reclaim' if args.dry_run else 'reclaimed'
+    )
+
 def commandReset(args):
     answer = raw_input('Do you really want to rewrite the database?(y/n) ')
     if answer == 'y':
-        createTableCasts()
-        createTableShows()
+        db.reset()
     else:
-        print 'nevermind'
+        logger.info('nevermind')
     
 
 def main(args):
@@ -922,6 +1317,16 @@ def main(args):
     parser = argparse.ArgumentParser(
         description='A command line Podcast downloader for RSS XML feeds'
     )
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        '-v', '--verbose', action='store_const', dest='log_level',
+        const=logging.DEBUG, default=logging.INFO,
+        help='show debug-messages too'
+    )
+    verbosity.add_argument(
+        '-q', '--quiet', action='store_const', dest='log_level',
+        const=logging.WARNING, help='show only warnings and errors'
+    )
     commands = parser.add_subparsers()
     
     #command add
@@ -936,7 +1341,33 @@ def main(args):
     command_update = commands.add_parser('update')
     command_update.add_argument(
         'feedId', 
-        help='feed-id to update or \'all\'')
+        help='feed-id to update, \'all\' or only the \'due\' ones')
+    command_update.add_argument(
+        '-j', '--jobs', type=int, default=UPDATE_JOBS,
+        help='number of feeds to fetch at the same time (default: %d)' % (
+            UPDATE_JOBS)
+    )
+    command_update.add_argument(
+        '-e', '--engine', choices=('threads', 'async'), default='threads',
+        help='fetch feeds with worker-threads or from one '
+        'event-driven thread (default: threads)'
+    )
+    command_update.add_argument(
+        '--full', action='store_true',
+        help='read every entry of the feeds, not only the newest'
+    )
+    command_update.add_argument(
+        '--stream', action='store_true',
+        help='parse the feeds entry by entry (for very big feeds)'
+    )
+    command_update.add_argument(
+        '--slowest', type=int, nargs='?', const=10, default=0, metavar='N',
+        help='show timings of the N slowest feeds (default: 10)'
+    )
+    command_update.add_argument(
+        '--metrics', metavar='FILE', default=METRICS_PATH,
+        help='append the timings of every feed as JSON lines to FILE'
+    )
     command_update.set_defaults(func=commandUpdateAll)
     
     #command status
@@ -950,8 +1381,39 @@ def main(args):
     command_status.add_argument(
         '-c', '--casts', help='list all podcasts', action='store_true'
     )
+    command_status.add_argument(
+        '--limit', type=int, default=-1, metavar='N',
+        help='show at most N posts with -n or -l'
+    )
+    command_status.add_argument(
+        '--after', type=int, metavar='SHOW_ID',
+        help='continue the list of -n or -l after this post'
+    )
+    command_status.add_argument(
+        '-t', '--tab', action='store_true',
+        help='tab-separated lines for scripts: id, cast-id, published, '
+        'status, title'
+    )
     command_status.set_defaults(func=commandStatus)
 
+    #command search
+    command_search = commands.add_parser(
+        'search', help='find casts and shows by words of their titles'
+    )
+    command_search.add_argument(
+        'words', nargs='+',
+        help='words of the title, subtitle or author, also beginnings'
+    )
+    command_search.add_argument(
+        '-n', '--limit', type=int, default=SEARCH_LIMIT,
+        help='best matches to show (default: %d)' % SEARCH_LIMIT
+    )
+    command_search.add_argument(
+        '-s', '--shows-only', action='store_true',
+        help='don\'t search the cast-titles'
+    )
+    command_search.set_defaults(func=commandSearch)
+
     #command get
     command_get = commands.add_parser('get')
     get_group = command_get.add_mutually_exclusive_group()
@@ -977,6 +1439,15 @@ def main(args):
         type=int,
         help='get image of the show with this id',
     )
+    command_get.add_argument(
+        '-j', '--jobs', type=int, default=DOWNLOAD_JOBS,
+        help='parallel downloads with --all (default: %d)' % DOWNLOAD_JOBS
+    )
+    command_get.add_argument(
+        '--per-host', type=int, default=DOWNLOAD_JOBS_PER_HOST,
+        help='parallel downloads from one host with --all (default: %d)' % (
+            DOWNLOAD_JOBS_PER_HOST)
+    )
     command_get.set_defaults(func=commandGet)
 
     #command changeUrl
@@ -995,11 +1466,33 @@ def main(args):
     )
     command_remove.set_defaults(func=commandRemove)
 
+    #command rescan
+    command_rescan = commands.add_parser(
+        'rescan', help='update the index of downloaded files from disk'
+    )
+    command_rescan.set_defaults(func=commandRescan)
+
+    #command dedupe
+    command_dedupe = commands.add_parser(
+        'dedupe', help='hard-link downloaded files with equal content'
+    )
+    command_dedupe.add_argument(
+        '-j', '--jobs', type=int, default=DOWNLOAD_JOBS,
+        help='files hashed at the same time (default: %d)' % DOWNLOAD_JOBS
+    )
+    command_dedupe.add_argument(
+        '-n', '--dry-run', action='store_true',
+        help='only report what would be linked'
+    )
+    command_dedupe.set_defaults(func=commandDedupe)
+
     #command reset
     command_reset = commands.add_parser('reset')
     command_reset.set_defaults(func=commandReset)    
 
     arguments = parser.parse_args(args)
+    setupLogging(arguments.log_level, min(arguments.log_level, logging.INFO))
+    db.migrate()
     arguments.func(arguments)
     
 if __name__ == '__main__':
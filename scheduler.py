@@ -0,0 +1,43 @@
+"""When to look at a feed again.
+
+Every cast gets its own poll-interval, learned from the dates of its
+last episodes: a daily show is polled a few times a day, a monthly
+one every couple of days. Shows that stopped publishing back off up
+to MAX_INTERVAL. A bit of jitter keeps casts that were added together
+from falling due together forever.
+"""
+
+import random
+
+#episodes looked at to learn the cadence of a feed
+HISTORY = 10
+#polls per typical gap between two episodes
+POLLS_PER_EPISODE = 4
+#limits of the poll-interval in seconds
+MIN_INTERVAL = 2 * 3600
+MAX_INTERVAL = 7 * 86400
+#the next poll is moved by up to this fraction of the interval
+JITTER = 0.1
+
+
+def getInterval(published, now, minimum=MIN_INTERVAL, maximum=MAX_INTERVAL):
+    """poll-interval in seconds for a feed whose episodes were
+    published at these epochs (newest first)
+    """
+    published = [p for p in published if p is not None and p <= now]
+    if len(published) < 2:
+        # nothing to learn from yet, look often
+        return minimum
+    gaps = sorted(
+        newer - older for newer, older in zip(published, published[1:])
+    )
+    # the median, single specials or long breaks don't count much
+    interval = gaps[len(gaps) // 2] // POLLS_PER_EPISODE
+    # a feed that is silent for longer than usual has probably paused
+    interval = max(interval, (now - published[0]) // (2 * POLLS_PER_EPISODE))
+    return int(min(max(interval, minimum), maximum))
+
+def getNextUpdate(interval, now):
+    """epoch of the next poll after now
+    """
+    return int(now + interval * (1 + random.uniform(-JITTER, JITTER)))
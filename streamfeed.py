@@ -0,0 +1,234 @@
+"""Streaming parser for big RSS/Atom feeds.
+
+feedparser builds the whole document before the first entry can be
+looked at. This module reads the feed with an incremental XML parser
+and yields one entry at a time, with only the fields Post.fromRssEntry
+uses (title, subtitle, author, published, links). Memory is bounded by
+the biggest entry instead of by the feed. Malformed feeds fall back to
+feedparser.
+"""
+
+import tempfile
+import urllib2
+import xml.etree.cElementTree as ElementTree
+
+import feedparser
+
+import httppool
+
+#feeds up to this size are spooled in memory for the fallback
+SPOOL_SIZE = 1024 * 1024
+
+#namespace -> the prefix feedparser files its elements under, RSS
+#2.0 and Atom elements come without
+NAMESPACES = {
+    '': '',
+    'http://www.w3.org/2005/atom': '',
+    'http://purl.org/atom/ns#': '',
+    'http://www.itunes.com/dtds/podcast-1.0.dtd': 'itunes',
+    'http://purl.org/dc/elements/1.1/': 'dc',
+    'http://purl.org/dc/terms/': 'dcterms',
+}
+#(prefix, tag) -> field like feedparser fills it: the title is the
+#first one that isn't empty, for the others the last one wins.
+#dc:date is no 'published' for feedparser, it goes to 'updated'.
+TEXT_FIELDS = {
+    ('', 'title'): 'title',
+    ('', 'subtitle'): 'subtitle',
+    ('itunes', 'subtitle'): 'subtitle',
+    ('', 'author'): 'author',
+    ('itunes', 'author'): 'author',
+    ('dc', 'creator'): 'author',
+    ('dc', 'author'): 'author',
+    ('', 'pubDate'): 'published',
+    ('', 'published'): 'published',
+    ('', 'issued'): 'published',
+    ('dcterms', 'issued'): 'published',
+}
+ENTRY_TAGS = ('item', 'entry')
+
+
+class Entry(dict):
+    """feed-entry with attribute-access like feedparser's entries
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class StreamResult(Entry):
+    """stand-in for the result of feedparser.parse. 'entries' is a
+    generator, so it can be walked only once.
+    """
+    def __init__(self, entries=(), status=None, etag=None, modified=None,
+                 href=None):
+        Entry.__init__(self, entries=entries, feed=Entry(), bozo=0)
+        for key, value in (('status', status), ('etag', etag),
+                           ('modified', modified), ('href', href)):
+            if value is not None:
+                self[key] = value
+
+
+def parse(url, etag=None, modified=None):
+    """fetch url and return a StreamResult. ETag and Last-Modified
+    are sent along like feedparser does, an unchanged feed comes
+    back with status 304 and without entries.
+    """
+    try:
+        response = httppool.urlopen(
+            url, httppool.getConditionalHeaders(etag, modified))
+    except urllib2.HTTPError as e:
+        if e.code == 304:
+            return StreamResult([], 304, href=url)
+        raise
+    info = response.info()
+    return StreamResult(
+        _closing(iterEntries(response), response),
+        response.getcode(),
+        info.getheader('ETag'),
+        info.getheader('Last-Modified'),
+        response.geturl()
+    )
+
+def parseFile(fh):
+    """return a StreamResult for an open feed-file
+    """
+    return StreamResult(iterEntries(fh))
+
+def iterEntries(fh):
+    """yield the entries of the feed in fh one by one. If the XML
+    turns out to be malformed, the rest of the feed is handed to
+    feedparser and its entries after the ones yielded so far follow.
+    """
+    spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    source = _TeeReader(fh, spool)
+    count = 0
+    try:
+        for entry in _iterParse(source):
+            count += 1
+            yield entry
+    except ElementTree.ParseError:
+        source.drain()
+        spool.seek(0)
+        rss = feedparser.parse(spool)
+        for entry in rss.entries[count:]:
+            yield entry
+    finally:
+        spool.close()
+
+def _iterParse(source):
+    stack = []
+    entry = None
+    # name and email of the atom-author being read
+    person = {}
+    for event, elem in ElementTree.iterparse(source, ('start', 'end')):
+        tag = _localName(elem.tag)
+        if event == 'start':
+            if tag in ENTRY_TAGS and entry is None:
+                entry = Entry(links=[])
+            elif tag == 'author':
+                person = {}
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if entry is None:
+            continue
+        if tag in ENTRY_TAGS:
+            yield entry
+            entry = None
+            # drop the entry from the tree, so it doesn't grow
+            if stack:
+                stack[-1].remove(elem)
+            continue
+        parent = _localName(stack[-1].tag) if stack else None
+        if tag == 'enclosure':
+            entry['links'].append(Entry(
+                rel='enclosure',
+                href=elem.get('url', ''),
+                type=elem.get('type', 'no_type'),
+                length=elem.get('length', '0'),
+            ))
+        elif tag == 'link':
+            if elem.get('href'):
+                link = Entry(
+                    rel=elem.get('rel', 'alternate'), href=elem.get('href')
+                )
+                if elem.get('type'):
+                    link['type'] = elem.get('type')
+            else:
+                link = Entry(
+                    rel='alternate', type='text/html',
+                    href=(elem.text or '').strip()
+                )
+            entry['links'].append(link)
+        elif tag in ('name', 'email') and parent == 'author':
+            # atom: <author><name>...</name><email>...</email></author>
+            person[tag] = _text(elem)
+        elif parent in ENTRY_TAGS:
+            field = TEXT_FIELDS.get((_prefix(elem.tag), tag))
+            if field is None:
+                continue
+            if tag == 'author' and person:
+                text = _personName(person)
+            else:
+                text = _text(elem)
+            if field != 'title' or not entry.get('title'):
+                entry[field] = text
+
+def _localName(tag):
+    """'{namespace}name' -> 'name'
+    """
+    return tag.rsplit('}', 1)[-1]
+
+def _prefix(tag):
+    """feedparser's prefix of the namespace of tag, None for the
+    ones it doesn't know
+    """
+    if not tag.startswith('{'):
+        return ''
+    return NAMESPACES.get(tag[1:].split('}', 1)[0].lower())
+
+def _personName(person):
+    """'name (email)' like feedparser's author of an atom-entry
+    """
+    name = person.get('name', u'')
+    email = person.get('email', u'')
+    if name and email:
+        return u'%s (%s)' % (name, email)
+    return name or email
+
+def _text(elem):
+    # cElementTree returns str for pure ascii
+    return unicode((elem.text or '').strip())
+
+def _closing(entries, response):
+    """yield from entries and close response at the end
+    """
+    try:
+        for entry in entries:
+            yield entry
+    finally:
+        response.close()
+
+
+class _TeeReader(object):
+    """file-like that copies everything read from fh into spool
+    """
+    def __init__(self, fh, spool):
+        self.fh = fh
+        self.spool = spool
+
+    def read(self, size=-1):
+        data = self.fh.read(size)
+        self.spool.write(data)
+        return data
+
+    def drain(self):
+        """read what is left of fh into spool
+        """
+        while self.read(65536):
+            pass
+
@@ -0,0 +1,201 @@
+"""Tagging of downloaded media-files.
+
+Every file gets PODCAST_STATUS = new, useful for foobar2000's
+dynamic-playlist function, mp3-files without title the title of the
+post. The container is recognized once from the first bytes of the
+file (and its MIME type, guessed from the name, if they don't tell),
+then exactly one mutagen-class opens it.
+
+TaggingPool does this in background-threads, so downloads don't wait
+for it:
+
+    pool = TaggingPool(workers=2)
+    pool.add(path, title)           # right after a download
+    stats = pool.close()            # waits, {format: TagStats}
+    pool.report()                   # logs throughput and failures
+
+Failures are only logged at DEBUG while the pool runs, report() shows
+them, so they don't break the progress-line of the downloads.
+"""
+
+import mimetypes
+import os
+import Queue
+import threading
+import time
+
+from mutagen import File as mutagen_File
+from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TXXX
+from mutagen.mp4 import MP4
+
+from helper import logger
+
+TAGGING_JOBS = 2
+
+MIME_FORMATS = {
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+    'audio/mp4': 'mp4',
+    'audio/x-m4a': 'mp4',
+    'audio/m4a': 'mp4',
+    'video/mp4': 'mp4',
+    'audio/x-m4b': 'mp4',
+    'audio/ogg': 'ogg',
+    'audio/flac': 'flac',
+}
+
+
+def detectFormat(path, mimeType=None):
+    """'mp3', 'mp4', 'ogg', 'flac' or 'unknown' by the magic bytes at
+    the start of the file, by mimeType if they aren't known
+    """
+    with open(path, 'rb') as fh:
+        head = fh.read(12)
+    if head.startswith('ID3'):
+        return 'mp3'
+    if head[4:8] == 'ftyp':
+        return 'mp4'
+    if head.startswith('OggS'):
+        return 'ogg'
+    if head.startswith('fLaC'):
+        return 'flac'
+    if len(head) > 1 and ord(head[0]) == 0xFF and ord(head[1]) & 0xE0 == 0xE0:
+        # mpeg audio frame-sync, mp3 without tags
+        return 'mp3'
+    if mimeType is None:
+        mimeType = mimetypes.guess_type(path)[0]
+    return MIME_FORMATS.get(mimeType, 'unknown')
+
+def tagFile(path, title, mimeType=None):
+    """tag one file and return its format. Raises on failure.
+    """
+    fileFormat = detectFormat(path, mimeType)
+    TAGGERS.get(fileFormat, _tagOther)(path, title)
+    return fileFormat
+
+def _tagMp3(path, title):
+    try:
+        audio = ID3(path)
+    except ID3NoHeaderError:
+        audio = ID3()
+    if 'TIT2' not in audio:
+        audio.add(TIT2(encoding=3, text=title))
+    audio.add(TXXX(encoding=3, desc="PODCAST_STATUS", text="new"))
+    audio.save(path)
+
+def _tagMp4(path, title):
+    audio = MP4(path)
+    audio['----:com.apple.iTunes:PODCAST_STATUS'] = "new"
+    audio.save()
+
+def _tagOther(path, title):
+    audio = mutagen_File(path)
+    if audio is None:
+        raise ValueError("unknown file-format")
+    if audio.tags is None:
+        audio.add_tags()
+    audio["title"] = os.path.basename(path)
+    audio['podcast_status'] = 'new'
+    audio.save()
+
+TAGGERS = {
+    'mp3': _tagMp3,
+    'mp4': _tagMp4,
+}
+
+
+class TagStats(object):
+    """files, failures, bytes and seconds of one format
+    """
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+
+class TaggingPool(object):
+    """worker-threads tagging the files of a queue
+    """
+    def __init__(self, workers=TAGGING_JOBS):
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.failures = []
+        self.started = time.time()
+        self.workers = []
+        for i in range(max(1, workers)):
+            worker = threading.Thread(target=self._work, name='tagger-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def add(self, path, title, mimeType=None, after=None):
+        """queue a downloaded file, after() is called once it is
+        tagged (or tagging failed)
+        """
+        self.queue.put((path, title, mimeType, after))
+
+    def close(self):
+        """wait for the queued files and return the stats by format
+        """
+        for worker in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            # joining with a timeout keeps ctrl-c working
+            while worker.is_alive():
+                worker.join(0.5)
+        return self.stats
+
+    def report(self):
+        """log throughput and failures per format, then the files
+        that failed
+        """
+        seconds = time.time() - self.started
+        files = sum(stats.files for stats in self.stats.values())
+        if not files:
+            return
+        logger.info("%d files tagged in %0.1f s (%0.1f files/s).",
+            files, seconds, files / max(seconds, 0.001))
+        for fileFormat, stats in sorted(self.stats.items()):
+            logger.info("  %-7s %4d files, %3d failed, %0.1f MB/s",
+                fileFormat, stats.files, stats.failed,
+                stats.bytes / 1048576.0 / max(stats.seconds, 0.001))
+        for message, path, error in self.failures:
+            logger.warning(message, path, error)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            path, title, mimeType, after = job
+            start = time.time()
+            fileFormat = 'unknown'
+            failed = False
+            try:
+                fileFormat = detectFormat(path, mimeType)
+                TAGGERS.get(fileFormat, _tagOther)(path, title)
+            except Exception as e:
+                failed = True
+                self._fail("Couldn't tag audio-file: %s (%s)", path, e)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            with self.lock:
+                stats = self.stats.setdefault(fileFormat, TagStats())
+                stats.files += 1
+                stats.failed += failed
+                stats.bytes += size
+                stats.seconds += time.time() - start
+            if after is not None:
+                try:
+                    after()
+                except Exception as e:
+                    self._fail("after tagging %s: %s", path, e)
+
+    def _fail(self, message, path, error):
+        logger.debug(message, path, error)
+        with self.lock:
+            self.failures.append((message, path, error))